@@ -0,0 +1,25 @@
+# coding=utf-8
+
+"""Microbenchmarks, run as `python -m benchmarks.<name>`."""
+
+import os
+import sys
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup():
+    """Configure Django like manage.py does."""
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+    import django
+    django.setup()
+
+
+def measure(name, function, number=1000, repeat=3):
+    """Print best time per call of function."""
+    best = min(timeit.repeat(function, number=number, repeat=repeat))
+    print('{:<40} {:>10.1f} us/call'.format(name, best / number * 1e6))
+    return best / number
@@ -0,0 +1,34 @@
+# coding=utf-8
+
+"""Emails rendering benchmark.
+
+Compares `render_to_string` per part, as emails were rendered before,
+with cached templates of `users.emails`.
+"""
+
+from . import measure, setup
+
+
+def main():
+    setup()
+
+    from django.template.loader import render_to_string
+    from users import emails
+
+    context = {'code': '123456'}
+
+    def uncached():
+        message = render_to_string(
+            emails.VERIFICATION['template'] + '.html', context
+        )
+        return message, message
+
+    def cached():
+        return emails.render(emails.VERIFICATION, context)
+
+    measure('render_to_string', uncached)
+    measure('users.emails.render', cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# coding=utf-8
+
+"""Middleware overhead benchmark.
+
+Compares API request through full `MIDDLEWARE_CLASSES` stack, as before
+`SCOPED_MIDDLEWARE`, with scoped chain. Anonymous profile request is
+rejected by view without queries, so time is mostly request handling.
+"""
+
+from . import measure, setup
+
+
+def main():
+    setup()
+
+    from django.conf import settings
+    from django.core.handlers.base import BaseHandler
+    from django.test import RequestFactory, override_settings
+
+    factory = RequestFactory(SERVER_NAME='localhost')
+
+    for label, middleware in (
+        ('full', settings.FULL_MIDDLEWARE),
+        ('scoped', settings.MIDDLEWARE_CLASSES),
+    ):
+        with override_settings(MIDDLEWARE_CLASSES=middleware):
+            handler = BaseHandler()
+            handler.load_middleware()
+
+        for path in ('/api/v1/profile', '/admin/login/'):
+            measure(
+                '{} {}'.format(path, label),
+                lambda: handler.get_response(factory.get(path)), number=200
+            )
+
+
+if __name__ == '__main__':
+    main()
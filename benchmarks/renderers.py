@@ -0,0 +1,66 @@
+# coding=utf-8
+
+"""JSON renderer and parser benchmark.
+
+Compares stock DRF JSON renderer and parser with `api.renderers` and
+`api.parsers`, which use orjson when it's installed.
+"""
+
+import datetime
+import decimal
+import io
+import uuid
+
+from . import measure, setup
+
+
+def payloads():
+    from django.utils.translation import ugettext_lazy as _
+
+    user = {
+        'id': 1, 'email': 'test@email.com', 'name': 'Name',
+        'surname': 'Surname', 'is_active': True, 'is_staff': False,
+        'last_login': datetime.datetime(2016, 1, 1, 12, 30),
+    }
+    return [
+        ('profile', user),
+        ('error', {'non_field_errors': [_('Codes don\'t match')]}),
+        ('devices', [
+            {'id': uuid.uuid4(), 'registration_id': 'a' * 64,
+             'active': True, 'amount': decimal.Decimal('1.5')}
+            for i in range(10)
+        ]),
+        ('users page', {'next': None, 'results': [user] * 100}),
+    ]
+
+
+def main():
+    setup()
+
+    from rest_framework import parsers as stock_parsers
+    from rest_framework import renderers as stock_renderers
+    from api import parsers, renderers
+
+    print('orjson: {}'.format(
+        'installed' if renderers.orjson else 'not installed'
+    ))
+
+    for name, data in payloads():
+        for label, renderer, parser in (
+            ('stock', stock_renderers.JSONRenderer(),
+             stock_parsers.JSONParser()),
+            ('api', renderers.JSONRenderer(), parsers.JSONParser()),
+        ):
+            content = renderer.render(data)
+            measure(
+                'render {} {}'.format(name, label),
+                lambda: renderer.render(data)
+            )
+            measure(
+                'parse {} {}'.format(name, label),
+                lambda: parser.parse(io.BytesIO(content))
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# coding=utf-8
+
+"""Compiled serializers benchmark.
+
+Compares stock `ModelSerializer` representation with serializers using
+`api.compiled`, for single object and `many=True` lists.
+"""
+
+from . import measure, setup
+
+
+def main():
+    setup()
+
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from rest_framework import serializers
+    from api.v1.serializers import UserDirectorySerializer
+
+    class StockSerializer(serializers.ModelSerializer):
+
+        class Meta(UserDirectorySerializer.Meta):
+            pass
+
+    users = [
+        get_user_model()(
+            id=i, email='user{}@email.com'.format(i), name='Name',
+            surname='Surname', is_active=True, last_login=timezone.now()
+        ) for i in range(100)
+    ]
+
+    for label, serializer_class in (
+        ('stock', StockSerializer), ('compiled', UserDirectorySerializer)
+    ):
+        measure(
+            'single {}'.format(label),
+            lambda: serializer_class(users[0]).data
+        )
+        measure(
+            'many=True x100 {}'.format(label),
+            lambda: serializer_class(users, many=True).data, number=100
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# coding=utf-8
+
+"""Compiled read-only representation of serializers.
+
+`Serializer.to_representation` builds serializer fields, introspecting
+model for `ModelSerializer`, then dispatches `get_attribute` and
+`to_representation` for each field of each object. Plan compiled once
+per serializer class reads concrete model fields with `attrgetter` and
+converts simple types with builtins, other fields keep their own methods.
+
+Plan is built without serializer context, so compiled serializers must
+not have fields depending on request.
+"""
+
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import six
+from rest_framework import fields, serializers
+from rest_framework.fields import SkipField
+
+from utils.timing import timer
+
+# Key order of plain dict is arbitrary on Python 2.
+DICT_CLASS = OrderedDict if six.PY2 else dict
+
+# Fields which representation of not None model value is builtin call.
+CONVERTERS = {
+    fields.BooleanField: bool,
+    fields.CharField: six.text_type,
+    fields.EmailField: six.text_type,
+    fields.IntegerField: int,
+    fields.ReadOnlyField: None,
+}
+
+_plans = {}
+
+
+def _is_concrete(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete and not field.is_relation
+
+
+class Plan(object):
+
+    """Field accessors of serializer class."""
+
+    def __init__(self, serializer_class):
+        prototype = serializer_class()
+        model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+        self.steps = []
+
+        for field in prototype._readable_fields:
+            source = field.source_attrs
+            if model is not None and len(source) == 1 and \
+                    type(field) in CONVERTERS and \
+                    _is_concrete(model, source[0]):
+                step = (attrgetter(source[0]), CONVERTERS[type(field)])
+            else:
+                step = (field.get_attribute, field.to_representation)
+            self.steps.append((field.field_name,) + step)
+
+    def represent(self, instance):
+        ret = DICT_CLASS()
+
+        for name, get, convert in self.steps:
+            try:
+                value = get(instance)
+            except SkipField:
+                continue
+
+            if value is None or convert is None:
+                ret[name] = value
+            else:
+                ret[name] = convert(value)
+
+        return ret
+
+
+def plan(serializer_class):
+    """Compiled plan of serializer class, cached."""
+    try:
+        return _plans[serializer_class]
+    except KeyError:
+        return _plans.setdefault(serializer_class, Plan(serializer_class))
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+
+    """List serializer representing children with compiled plan."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        represent = plan(type(self.child)).represent
+        with timer('serializer'):
+            return [represent(item) for item in iterable]
+
+
+class CompiledSerializerMixin(object):
+
+    """Represent instances with compiled plan of serializer class."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        allow_empty = kwargs.pop('allow_empty', None)
+        list_kwargs = {'child': cls(*args, **kwargs)}
+        if allow_empty is not None:
+            list_kwargs['allow_empty'] = allow_empty
+        list_kwargs.update(
+            (key, value) for key, value in kwargs.items()
+            if key in serializers.LIST_SERIALIZER_KWARGS
+        )
+        return CompiledListSerializer(*args, **list_kwargs)
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return plan(type(self)).represent(instance)
@@ -0,0 +1,93 @@
+# coding=utf-8
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.module_loading import import_string
+
+
+class MiddlewareChain(object):
+
+    """Loaded middleware methods, in order Django handler calls them."""
+
+    def __init__(self, paths):
+        self.request, self.view = [], []
+        self.template_response, self.response, self.exception = [], [], []
+
+        for path in paths:
+            try:
+                middleware = import_string(path)()
+            except MiddlewareNotUsed:
+                continue
+
+            if hasattr(middleware, 'process_request'):
+                self.request.append(middleware.process_request)
+            if hasattr(middleware, 'process_view'):
+                self.view.append(middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response.insert(
+                    0, middleware.process_template_response
+                )
+            if hasattr(middleware, 'process_response'):
+                self.response.insert(0, middleware.process_response)
+            if hasattr(middleware, 'process_exception'):
+                self.exception.insert(0, middleware.process_exception)
+
+
+class ScopedMiddleware(object):
+
+    """Run middleware chain chosen by request path prefix.
+
+    Chains are configured in `SCOPED_MIDDLEWARE` as `(prefix, paths)`
+    pairs, first matching prefix wins, requests matching none run without
+    middleware.
+    """
+
+    def __init__(self):
+        self.scopes = [
+            (prefix, MiddlewareChain(paths))
+            for prefix, paths in settings.SCOPED_MIDDLEWARE
+        ]
+        self.empty = MiddlewareChain(())
+
+    def get_chain(self, request):
+        try:
+            return request._middleware_chain
+        except AttributeError:
+            pass
+
+        chain = self.empty
+        for prefix, scope in self.scopes:
+            if request.path_info.startswith(prefix):
+                chain = scope
+                break
+
+        request._middleware_chain = chain
+        return chain
+
+    def process_request(self, request):
+        for method in self.get_chain(request).request:
+            response = method(request)
+            if response:
+                return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for method in self.get_chain(request).view:
+            response = method(request, view_func, view_args, view_kwargs)
+            if response:
+                return response
+
+    def process_template_response(self, request, response):
+        for method in self.get_chain(request).template_response:
+            response = method(request, response)
+        return response
+
+    def process_response(self, request, response):
+        for method in self.get_chain(request).response:
+            response = method(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        for method in self.get_chain(request).exception:
+            response = method(request, exception)
+            if response:
+                return response
@@ -0,0 +1,60 @@
+# coding=utf-8
+
+from rest_framework import renderers
+
+from utils.timing import timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Escaped as DRF does, JSON stays strict JavaScript subset.
+LINE_SEPARATORS = (
+    (b'\xe2\x80\xa8', b'\\u2028'),
+    (b'\xe2\x80\xa9', b'\\u2029'),
+)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+
+    """JSON renderer using orjson when installed.
+
+    Types orjson doesn't know, lazy translations and decimals, and
+    datetimes, to keep DRF format, go through DRF encoder. Indented,
+    ASCII only or non compact output falls back to stock renderer.
+    """
+
+    def __init__(self):
+        self.default = self.encoder_class().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer('render'):
+            return self.dumps(data, accepted_media_type, renderer_context)
+
+    def dumps(self, data, accepted_media_type, renderer_context):
+        if orjson is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type,
+                                renderer_context or {}) is not None:
+            return super(JSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+
+        if data is None:
+            return bytes()
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        except TypeError:
+            # Non string keys, too big integers.
+            return super(JSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
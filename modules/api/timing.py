@@ -0,0 +1,177 @@
+# coding=utf-8
+
+"""Per request timings of API views.
+
+`TimingMiddleware` records `utils.timing.timer` blocks of request, adds
+query count and time, emits timings as `Server-Timing` header and
+aggregates per endpoint histograms, exported in Prometheus text format
+by `registry.export()`.
+"""
+
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import connections
+
+from utils.timing import QueryLog, start, stop
+
+# Histogram upper bounds in seconds.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(object):
+
+    """Cumulative histogram of observed durations."""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+class Registry(object):
+
+    """Histograms per endpoint and component, in process memory."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = OrderedDict()
+        self.queries = OrderedDict()
+
+    def observe(self, endpoint, recorder, total):
+        with self.lock:
+            durations = [('total', total)] + list(recorder.durations.items())
+            for component, duration in durations:
+                key = (endpoint, component)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].observe(duration)
+
+            self.queries[endpoint] = \
+                self.queries.get(endpoint, 0) + recorder.queries
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.queries.clear()
+
+    def export(self):
+        """Histograms in Prometheus text exposition format."""
+        lines = [
+            '# HELP api_request_seconds Time spent in API request.',
+            '# TYPE api_request_seconds histogram',
+        ]
+
+        with self.lock:
+            for (endpoint, component), histogram in self.histograms.items():
+                labels = 'endpoint="{}",component="{}"'.format(
+                    endpoint, component
+                )
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    lines.append(
+                        'api_request_seconds_bucket{{{},le="{}"}} {}'.format(
+                            labels, bound, count
+                        )
+                    )
+                lines.extend([
+                    'api_request_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                        labels, histogram.count
+                    ),
+                    'api_request_seconds_sum{{{}}} {!r}'.format(
+                        labels, histogram.sum
+                    ),
+                    'api_request_seconds_count{{{}}} {}'.format(
+                        labels, histogram.count
+                    ),
+                ])
+
+            lines.extend([
+                '# HELP api_db_queries_total Queries of API requests.',
+                '# TYPE api_db_queries_total counter',
+            ])
+            for endpoint, count in self.queries.items():
+                lines.append('api_db_queries_total{{endpoint="{}"}} {}'.format(
+                    endpoint, count
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def export_metrics(metrics):
+    """Metrics in Prometheus text exposition format.
+
+    Metric is `(name, type, help, samples)`, samples is value or mapping of
+    labels to value.
+    """
+    lines = []
+    for name, kind, description, samples in metrics:
+        lines.extend([
+            '# HELP {} {}'.format(name, description),
+            '# TYPE {} {}'.format(name, kind),
+        ])
+        if not isinstance(samples, dict):
+            samples = {'': samples}
+        for labels, value in sorted(samples.items()):
+            lines.append('{}{} {!r}'.format(
+                name, '{{{}}}'.format(labels) if labels else '', value
+            ))
+    return '\n'.join(lines) + '\n'
+
+
+class TimingMiddleware(object):
+
+    """Record timings of request, enabled by `REQUEST_TIMING` setting.
+
+    Queries are counted from debug cursor log, forced on for the request.
+    """
+
+    def process_request(self, request):
+        options = settings.REQUEST_TIMING
+        if not (options['HEADER'] or options['HISTOGRAMS']):
+            return
+
+        start()
+        request._timing_queries = [
+            QueryLog(connection) for connection in connections.all()
+        ]
+        for log in request._timing_queries:
+            log.__enter__()
+
+    def process_response(self, request, response):
+        recorder = stop()
+        if recorder is None:
+            return response
+
+        for log in request._timing_queries:
+            log.__exit__(None, None, None)
+            recorder.queries += len(log.queries)
+            recorder.add('db', log.duration)
+        total = default_timer() - recorder.started
+
+        options = settings.REQUEST_TIMING
+        if options['HEADER']:
+            metrics = [
+                '{};dur={:.3f}'.format(name, duration * 1000)
+                for name, duration in recorder.durations.items()
+            ]
+            metrics.append('total;dur={:.3f}'.format(total * 1000))
+            metrics.append('queries;desc="{}"'.format(recorder.queries))
+            response['Server-Timing'] = ', '.join(metrics)
+
+        match = getattr(request, 'resolver_match', None)
+        if options['HISTOGRAMS'] and match is not None:
+            registry.observe(match.view_name, recorder, total)
+
+        return response
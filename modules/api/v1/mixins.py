@@ -1,5 +1,43 @@
 # coding=utf-8
 
+import calendar
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.http import parse_etags, quote_etag
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+from utils.timing import QueryLog
+from users.authentication import SignedTokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+# Not counted, tests wrap views into transaction so atomic uses savepoints.
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO')
+
+
+class PreconditionFailed(exceptions.APIException):
+
+    """Resource changed since client fetched it."""
+
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('Resource was modified, fetch it again.')
+
+
+class QueryBudgetExceeded(Exception):
+
+    """View ran more queries than its budget."""
+
+
+class TokenAuthenticationMixin(object):
+
+    """Token authentication only, API runs without session middleware."""
+
+    authentication_classes = (SignedTokenAuthentication,)
+
 
 class SerializerViewMixin(object):
 
@@ -9,3 +47,88 @@ class SerializerViewMixin(object):
 
     def get_serializer_class(self):
         return self.serializer_class
+
+
+class DeviceUpsertMixin(object):
+
+    """Register device to current user, existing device is reassigned."""
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data)
+
+
+class ConditionalMixin(object):
+
+    """ETag from modification stamp, checked before serialization."""
+
+    def get_etag(self, instance):
+        updated = instance.updated
+        return quote_etag('{}-{}{:06d}'.format(
+            instance.pk, calendar.timegm(updated.utctimetuple()),
+            updated.microsecond
+        ))
+
+    def not_modified(self, request, etag):
+        """Response 304 if client has current version, else None."""
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if header and (header.strip() == '*' or
+                       etag in map(quote_etag, parse_etags(header))):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        return None
+
+    def check_precondition(self, request, etag):
+        """Raise 412 if client modifies outdated version."""
+        header = request.META.get('HTTP_IF_MATCH')
+        if header and header.strip() != '*' and \
+                etag not in map(quote_etag, parse_etags(header)):
+            raise PreconditionFailed()
+
+
+class QueryBudgetMixin(object):
+
+    """Count queries of view against `query_budget`.
+
+    Budget is number of queries or mapping of lower case method to it.
+    Exceeded budget raises in `raise` mode of `QUERY_BUDGET` setting and
+    is logged with offending SQL in `warn` mode. Content of streaming
+    response is produced after dispatch and isn't counted.
+    """
+
+    query_budget = None
+
+    def get_query_budget(self, request):
+        if isinstance(self.query_budget, dict):
+            return self.query_budget.get(request.method.lower())
+        return self.query_budget
+
+    def dispatch(self, request, *args, **kwargs):
+        budget = self.get_query_budget(request)
+        if budget is None or settings.QUERY_BUDGET == 'off':
+            return super(QueryBudgetMixin, self).dispatch(
+                request, *args, **kwargs
+            )
+
+        with QueryLog(connections[DEFAULT_DB_ALIAS]) as log:
+            response = super(QueryBudgetMixin, self).dispatch(
+                request, *args, **kwargs
+            )
+
+        queries = [
+            query['sql'] for query in log.queries
+            if not query['sql'].startswith(TRANSACTION_STATEMENTS)
+        ]
+        if len(queries) > budget:
+            message = '{} {} ran {} queries, budget is {}:\n{}'.format(
+                request.method, request.path, len(queries), budget,
+                '\n'.join(queries)
+            )
+            if settings.QUERY_BUDGET == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
@@ -0,0 +1,140 @@
+# coding=utf-8
+
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+SCALAR_TYPES = six.string_types + six.integer_types + (float,)
+
+
+class KeysetPagination(pagination.BasePagination):
+
+    """Opaque cursor pagination on unique ordering, without counting.
+
+    Page is fetched with `WHERE (a, b) > (cursor) ORDER BY a, b LIMIT n`
+    written as `OR` of prefixes, so cost doesn't depend on page number.
+    """
+
+    INVALID_CURSOR = _('Invalid cursor')
+    INVALID_ORDERING = _('Invalid ordering')
+
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    # Ordering name to fields, last field must be unique.
+    orderings = OrderedDict([('id', ('id',))])
+
+    def get_fields(self, request):
+        name = request.query_params.get(
+            self.ordering_query_param, next(iter(self.orderings))
+        )
+        try:
+            return self.orderings[name]
+        except KeyError:
+            raise NotFound(self.INVALID_ORDERING)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        """Position from cursor, values are converted by model fields."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            position = json.loads(
+                base64.urlsafe_b64decode(cursor.encode('ascii'))
+                .decode('utf-8')
+            )
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.INVALID_CURSOR)
+
+        if not isinstance(position, list) or \
+                len(position) != len(self.fields):
+            raise NotFound(self.INVALID_CURSOR)
+
+        values = []
+        for field, value in zip(self.fields, position):
+            if not isinstance(value, SCALAR_TYPES) or \
+                    isinstance(value, bool):
+                raise NotFound(self.INVALID_CURSOR)
+            try:
+                value = model._meta.get_field(field).to_python(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.INVALID_CURSOR)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode('utf-8')
+        ).decode('ascii')
+
+    def after(self, position):
+        """Filter rows following position in lexicographic order."""
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            prefix = dict(zip(self.fields[:i], position[:i]))
+            prefix[field + '__gt'] = position[i]
+            condition |= Q(**prefix)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = self.get_fields(request)
+        size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.fields)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[:size + 1])
+        self.next_position = None
+        if len(rows) > size:
+            rows = rows[:size]
+            self.next_position = [
+                getattr(rows[-1], field) for field in self.fields
+            ]
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class UserPagination(KeysetPagination):
+
+    """Users directory pagination."""
+
+    orderings = OrderedDict([
+        ('id', ('id',)),
+        ('surname', ('surname', 'id')),
+    ])
@@ -1,18 +1,47 @@
 # coding=utf-8
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers, exceptions
 from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+from push_notifications.api import rest_framework as push_serializers
 
+from api.compiled import CompiledSerializerMixin
+from users import tokens
 from users.models import Confirmation
 from users.tasks import send_confirmation_email, send_restore_password_email
 
 
-class RegistrationSerializer(serializers.ModelSerializer):
+class NormalizedEmailField(serializers.EmailField):
+
+    """Email field with canonical case folded value."""
+
+    def to_internal_value(self, data):
+        return get_user_model().objects.normalize_email(
+            super(NormalizedEmailField, self).to_internal_value(data)
+        )
+
+
+def unique_email_field():
+    """Writable user email field, uniqueness is checked on canonical value."""
+    model = get_user_model()
+    return NormalizedEmailField(
+        max_length=model._meta.get_field('email').max_length,
+        validators=[UniqueValidator(queryset=model.objects.all())]
+    )
+
+
+class RegistrationSerializer(CompiledSerializerMixin,
+                             serializers.ModelSerializer):
 
     """Registration serializer."""
 
+    email = unique_email_field()
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -20,51 +49,61 @@ class RegistrationSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'name', 'surname', 'password')
 
     def create(self, data):
-        user = get_user_model().objects.create_user(**data)
-        confirmation = Confirmation.objects.create(user=user)
-        send_confirmation_email(confirmation)
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(**data)
+            confirmation = Confirmation.objects.issue(
+                user, Confirmation.VERIFICATION
+            )
+            send_confirmation_email(confirmation)
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
 
     """User serializer."""
 
+    email = unique_email_field()
+
     class Meta:
         model = get_user_model()
         fields = ('id', 'email', 'name', 'surname')
 
 
-class RegistrationConfirmationSerializer(serializers.Serializer):
+class UserDirectorySerializer(CompiledSerializerMixin,
+                              serializers.ModelSerializer):
 
-    """Registration confirmation serializer."""
+    """User directory serializer."""
 
-    USER_NOT_FOUND = _('User not found')
-    CODES_NOT_MATCH = _('Codes don\'t match')
+    class Meta:
+        model = get_user_model()
+        fields = (
+            'id', 'email', 'name', 'surname', 'is_active', 'is_staff',
+            'last_login'
+        )
 
-    email = serializers.EmailField(write_only=True)
-    code = serializers.CharField(write_only=True)
 
-    def validate(self, data):
-        try:
-            user = get_user_model().objects.get(email=data['email'])
-        except get_user_model().DoesNotExist:
-            raise serializers.ValidationError(self.USER_NOT_FOUND)
+class RegistrationConfirmationSerializer(serializers.Serializer):
 
-        try:
-            confirmation = user.confirmations.get(code=data['code'])
-        except Confirmation.DoesNotExist:
-            raise serializers.ValidationError(self.CODES_NOT_MATCH)
+    """Registration confirmation serializer."""
 
-        data['user'] = user
-        confirmation.delete()
+    CODES_NOT_MATCH = _('Codes don\'t match')
 
-        return data
+    email = NormalizedEmailField(write_only=True)
+    code = serializers.CharField(write_only=True)
 
     def save(self):
-        user = self.validated_data['user']
-        user.is_active = True
-        user.save()
+        with transaction.atomic():
+            user = Confirmation.objects.consume(
+                self.validated_data['email'], self.validated_data['code'],
+                Confirmation.VERIFICATION
+            )
+            if user is None:
+                raise serializers.ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [self.CODES_NOT_MATCH]
+                })
+
+            user.is_active = True
+            user.save(update_fields=['is_active'])
 
 
 class ReconfirmationSerializer(serializers.Serializer):
@@ -73,7 +112,7 @@ class ReconfirmationSerializer(serializers.Serializer):
 
     USER_NOT_FOUND = _('User not found')
 
-    email = serializers.EmailField(write_only=True)
+    email = NormalizedEmailField(write_only=True)
 
     def validate(self, data):
         try:
@@ -84,8 +123,11 @@ class ReconfirmationSerializer(serializers.Serializer):
         return data
 
     def create(self, data):
-        confirmation = Confirmation.objects.create(user=data['user'])
-        send_confirmation_email(confirmation)
+        with transaction.atomic():
+            confirmation = Confirmation.objects.issue(
+                data['user'], Confirmation.VERIFICATION
+            )
+            send_confirmation_email(confirmation)
         return confirmation
 
 
@@ -95,7 +137,7 @@ class RestorePasswordRequestSerializer(serializers.Serializer):
 
     USER_NOT_FOUND = _('User not found')
 
-    email = serializers.EmailField(write_only=True)
+    email = NormalizedEmailField(write_only=True)
 
     def validate(self, data):
         try:
@@ -106,8 +148,11 @@ class RestorePasswordRequestSerializer(serializers.Serializer):
         return data
 
     def create(self, data):
-        confirmation = Confirmation.objects.create(user=data['user'])
-        send_restore_password_email(confirmation)
+        with transaction.atomic():
+            confirmation = Confirmation.objects.issue(
+                data['user'], Confirmation.RESTORE_PASSWORD
+            )
+            send_restore_password_email(confirmation)
         return confirmation
 
 
@@ -115,34 +160,25 @@ class RestorePasswordSerializer(serializers.Serializer):
 
     """Restore password serializer."""
 
-    USER_NOT_FOUND = _('User not found')
     CODES_NOT_MATCH = _('Codes don\'t match')
 
-    email = serializers.EmailField(write_only=True)
+    email = NormalizedEmailField(write_only=True)
     code = serializers.CharField(write_only=True)
     password = serializers.CharField(write_only=True)
 
-    def validate(self, data):
-        try:
-            user = get_user_model().objects.get(email=data['email'])
-        except get_user_model().DoesNotExist:
-            raise serializers.ValidationError(self.USER_NOT_FOUND)
-
-        try:
-            confirmation = user.confirmations.get(code=data['code'])
-        except Confirmation.DoesNotExist:
-            raise serializers.ValidationError(self.CODES_NOT_MATCH)
-
-        data['user'] = user
-        confirmation.delete()
-
-        return data
-
     def save(self):
-        user = self.validated_data['user']
+        with transaction.atomic():
+            user = Confirmation.objects.consume(
+                self.validated_data['email'], self.validated_data['code'],
+                Confirmation.RESTORE_PASSWORD
+            )
+            if user is None:
+                raise serializers.ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [self.CODES_NOT_MATCH]
+                })
 
-        user.set_password(self.validated_data['password'])
-        user.save()
+            user.set_password(self.validated_data['password'])
+            user.save(update_fields=['password', 'token_version'])
 
 
 class ChangePasswordSerializer(serializers.ModelSerializer):
@@ -167,6 +203,7 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+
 class AuthenticationSerializer(serializers.Serializer):
 
     """Authentication serializer."""
@@ -176,12 +213,14 @@ class AuthenticationSerializer(serializers.Serializer):
 
     token = serializers.CharField(read_only=True)
 
-    email = serializers.EmailField(write_only=True)
+    email = NormalizedEmailField(write_only=True)
     password = serializers.CharField(write_only=True)
 
     def validate(self, data):
         try:
-            user = get_user_model().objects.get(email=data['email'])
+            user = get_user_model().objects.select_related(
+                'auth_token'
+            ).get(email=data['email'])
             if not user.check_password(data['password']):
                 raise ValueError()
         except (get_user_model().DoesNotExist, ValueError):
@@ -190,5 +229,177 @@ class AuthenticationSerializer(serializers.Serializer):
         if not user.is_active:
             raise exceptions.ValidationError(self.USER_INACTIVE)
 
-        data['token'] = Token.objects.get_or_create(user=user)[0].key
+        if settings.AUTH_TOKEN_MODE == 'signed':
+            data['token'] = tokens.issue(user)
+        else:
+            data['token'] = self.get_token(user).key
+
         return data
+
+    def get_token(self, user):
+        """Existing token joined to user or new one.
+
+        Insert is done in savepoint, so concurrent login which created
+        token first doesn't fail current one.
+        """
+        try:
+            return user.auth_token
+        except Token.DoesNotExist:
+            pass
+
+        try:
+            with transaction.atomic():
+                return Token.objects.create(user=user)
+        except IntegrityError:
+            return Token.objects.get(user=user)
+
+
+def lock_user(user):
+    """Lock user row until end of transaction.
+
+    Serializes device registrations of user, not ones of same device by
+    different users.
+    """
+    if user is not None:
+        list(
+            get_user_model().objects.select_for_update()
+            .filter(pk=user.pk).values_list('pk', flat=True)
+        )
+
+
+class DeviceSerializerMixin(object):
+
+    """Device serializer which registers device by upsert.
+
+    Existing device with same registration id is updated and reassigned
+    to new owner instead of failing uniqueness validation. Registrations
+    of one user are serialized by lock of owner row. GCM registration id
+    has no unique index, so concurrent registrations of same id by
+    different users may still both insert.
+    """
+
+    def create(self, data):
+        model = self.Meta.model
+        queryset = model.objects.filter(
+            registration_id=data['registration_id']
+        )
+
+        with transaction.atomic():
+            lock_user(data.get('user'))
+
+            if not queryset.update(**data):
+                try:
+                    with transaction.atomic():
+                        return model.objects.create(**data)
+                except IntegrityError:
+                    queryset.update(**data)
+
+        return queryset.latest('pk')
+
+    def create_many(self, items, user):
+        """Register many devices, returns created and updated counts.
+
+        Caller locks user row, see `lock_user`. Existing devices are
+        updated by single query, values differing per device are chosen
+        by registration id.
+        """
+        model = self.Meta.model
+        items = dict(
+            (item['registration_id'], dict(item, user=user)) for item in items
+        )
+
+        queryset = model.objects.filter(registration_id__in=list(items))
+        existing = set(queryset.values_list('registration_id', flat=True))
+
+        try:
+            with transaction.atomic():
+                created = self.save_many(items, existing, user)
+        except IntegrityError:
+            # Concurrent registration inserted some of new devices.
+            existing = set(
+                queryset.values_list('registration_id', flat=True)
+            )
+            created = self.save_many(items, existing, user)
+
+        return {'created': created, 'updated': len(items) - created}
+
+    def save_many(self, items, existing, user):
+        """Update existing devices, insert others, returns inserted count."""
+        model = self.Meta.model
+        new = [
+            model(**item) for registration_id, item in items.items()
+            if registration_id not in existing
+        ]
+
+        if existing:
+            model.objects.filter(registration_id__in=existing).update(
+                user=user, **self.update_values(
+                    [items[registration_id] for registration_id in existing]
+                )
+            )
+        model.objects.bulk_create(new)
+
+        return len(new)
+
+    def update_values(self, items):
+        """Update expressions of fields given in items, omitted are kept."""
+        model = self.Meta.model
+        names = set()
+        for item in items:
+            names.update(item)
+        names.difference_update(('registration_id', 'user'))
+
+        return dict(
+            (name, Case(
+                *[
+                    When(
+                        registration_id=item['registration_id'],
+                        then=Value(item[name])
+                    ) for item in items if name in item
+                ],
+                default=F(name), output_field=model._meta.get_field(name)
+            )) for name in names
+        )
+
+
+class APNSDeviceSerializer(CompiledSerializerMixin, DeviceSerializerMixin,
+                           push_serializers.APNSDeviceSerializer):
+
+    """APNS device serializer."""
+
+    class Meta(push_serializers.APNSDeviceSerializer.Meta):
+        extra_kwargs = {
+            'active': {'default': True},
+            'registration_id': {'validators': []},
+        }
+
+
+class GCMDeviceSerializer(CompiledSerializerMixin, DeviceSerializerMixin,
+                          push_serializers.GCMDeviceSerializer):
+
+    """GCM device serializer."""
+
+    class Meta(push_serializers.GCMDeviceSerializer.Meta):
+        extra_kwargs = {
+            'active': {'default': True},
+            'registration_id': {'validators': []},
+        }
+
+
+class DeviceBulkSerializer(serializers.Serializer):
+
+    """Bulk devices registration serializer."""
+
+    apns = APNSDeviceSerializer(many=True, required=False, write_only=True)
+    gcm = GCMDeviceSerializer(many=True, required=False, write_only=True)
+
+    def create(self, data):
+        user = data.pop('user')
+        result = {}
+
+        with transaction.atomic():
+            lock_user(user)
+            for name, items in data.items():
+                result[name] = self.fields[name].child.create_many(items, user)
+
+        return result
@@ -1,26 +1,52 @@
 # coding=utf-8
 
+import base64
+import datetime
+import decimal
 import json
 import importlib
+import logging
+import time
+import uuid
 
 from django import test
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
 
-from rest_framework import status
+from rest_framework import renderers, serializers, status
+from rest_framework.exceptions import ParseError
 from rest_framework.authtoken.models import Token
+from push_notifications.models import APNSDevice, GCMDevice
 
-from users.models import Confirmation
+from api import compiled, parsers, timing
+from api.renderers import JSONRenderer
+from users import codes, exports
+from users.authentication import denylist, token_cache
+from users.models import Confirmation, Email
 
 VERSION = __name__.split('.')[1]
 CONTENT_TYPE = 'application/json'
 CONSTANTS = importlib.import_module('api.{}.constants'.format(VERSION))
+SERIALIZERS = importlib.import_module('api.{}.serializers'.format(VERSION))
+MIXINS = importlib.import_module('api.{}.mixins'.format(VERSION))
+URLS = importlib.import_module('api.{}.urls'.format(VERSION))
+VIEWS = importlib.import_module('api.{}.views'.format(VERSION))
 EMAIL_BACKEND = 'django.core.mail.backends.dummy.EmailBackend'
+# Weak hasher isn't configured, it stands for hashes of legacy systems.
+OUTDATED_HASHERS = settings.PASSWORD_HASHERS + (
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+)
 
 
+@test.override_settings(QUERY_BUDGET='raise')
 class CompositeDocstringTestCase(test.TestCase):
 
-    """Test case with composite docstring."""
+    """Test case with composite docstring, query budgets enforced."""
 
     @classmethod
     def __new__(cls, *args, **kwargs):
@@ -35,6 +61,13 @@ class CompositeDocstringTestCase(test.TestCase):
                 )
         return cls
 
+    def run_on_commit(self):
+        """Run on commit callbacks at once, test transaction never commits."""
+        on_commit = transaction.on_commit
+        transaction.on_commit = lambda func, using=None: func()
+        self.addCleanup(setattr, transaction, 'on_commit', on_commit)
+        self.addCleanup(cache.clear)
+
 
 class APIClient(test.Client):
 
@@ -101,6 +134,18 @@ class RegistrationTest(CompositeDocstringTestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_with_existing_email_in_other_case(self):
+        """With existing email in other case."""
+        payload = {
+            'email': 'Test@Mail.com', 'password': 'pass',
+            'name': 'Test', 'surname': 'Test'
+        }
+        get_user_model().objects.create(email='test@mail.com', password='psw')
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_success(self):
         """Success."""
         payload = {
@@ -116,6 +161,10 @@ class RegistrationTest(CompositeDocstringTestCase):
 
         self.assertTrue(Confirmation.objects.filter(user=user).exists())
         self.assertTrue(user.check_password(payload['password']))
+        self.assertTrue(
+            Email.objects.filter(recipient=user.email, status=Email.PENDING)
+            .exists()
+        )
 
 
 @test.override_settings(EMAIL_BACKEND=EMAIL_BACKEND)
@@ -154,6 +203,112 @@ class ConfirmationTest(CompositeDocstringTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(user.is_active)
 
+    def test_with_expired_code(self):
+        """With expired code."""
+        payload = {'email': 'test@email.com'}
+        user = get_user_model().objects.create(payload['email'], password='pw')
+        confirmation = Confirmation.objects.create(user=user)
+        Confirmation.objects.filter(pk=confirmation.pk).update(
+            expired=confirmation.expired - Confirmation.LIFETIME
+        )
+        payload['code'] = confirmation.code
+
+        response = self.client.post(self.url, data=payload)
+        user.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(user.is_active)
+
+    def test_reuse(self):
+        """Code can't be used twice."""
+        payload = {'email': 'test@email.com'}
+        user = get_user_model().objects.create(payload['email'], password='pw')
+        payload['code'] = Confirmation.objects.create(user=user).code
+        self.client.post(self.url, data=payload)
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Confirmation.objects.exists())
+
+
+@test.override_settings(
+    EMAIL_BACKEND=EMAIL_BACKEND, CONFIRMATION_MODE='hmac'
+)
+class HMACConfirmationTest(CompositeDocstringTestCase):
+
+    """Test HMAC confirmation codes"""
+
+    url = reverse('api:{}:confirmation'.format(VERSION))
+    client = APIClient()
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            'test@email.com', password='pass'
+        )
+
+    def test_issue(self):
+        """Issue code without storing it."""
+        url = reverse('api:{}:reconfirmation'.format(VERSION))
+
+        response = self.client.post(url, data={'email': self.user.email})
+        code = codes.generate(self.user, Confirmation.VERIFICATION)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Confirmation.objects.exists())
+        self.assertIn(code, Email.objects.get().message)
+
+    def test_success(self):
+        """Success."""
+        payload = {
+            'email': self.user.email,
+            'code': codes.generate(self.user, Confirmation.VERIFICATION)
+        }
+
+        response = self.client.post(self.url, data=payload)
+        self.user.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.user.is_active)
+
+    def test_reuse(self):
+        """Code can't be used twice."""
+        payload = {
+            'email': self.user.email,
+            'code': codes.generate(self.user, Confirmation.VERIFICATION)
+        }
+        self.client.post(self.url, data=payload)
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_purpose(self):
+        """Code of other purpose rejected."""
+        payload = {
+            'email': self.user.email,
+            'code': codes.generate(self.user, Confirmation.RESTORE_PASSWORD)
+        }
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired(self):
+        """Code of expired window rejected."""
+        window = int(time.time()) // codes.window_size() - codes.WINDOWS
+        payload = {
+            'email': self.user.email,
+            'code': codes.generate(
+                self.user, Confirmation.VERIFICATION, window
+            )
+        }
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 @test.override_settings(EMAIL_BACKEND=EMAIL_BACKEND)
 class ReconfirmationTest(CompositeDocstringTestCase):
@@ -187,6 +342,20 @@ class ReconfirmationTest(CompositeDocstringTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(Confirmation.objects.filter(user=user).exists())
 
+    def test_repeat(self):
+        """Repeat request reuses confirmation and email."""
+        payload = {'email': 'test@email.com'}
+        get_user_model().objects.create_user(payload['email'], password='pw')
+        self.run_on_commit()
+
+        first = self.client.post(self.url, data=payload)
+        second = self.client.post(self.url, data=payload)
+
+        self.assertEqual(first.status_code, second.status_code)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(Confirmation.objects.count(), 1)
+        self.assertEqual(Email.objects.count(), 1)
+
 
 @test.override_settings(EMAIL_BACKEND=EMAIL_BACKEND)
 class RestorePasswordRequestTest(CompositeDocstringTestCase):
@@ -220,6 +389,20 @@ class RestorePasswordRequestTest(CompositeDocstringTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(Confirmation.objects.filter(user=user).exists())
 
+    def test_repeat(self):
+        """Repeat request reuses confirmation and email."""
+        payload = {'email': 'test@email.com'}
+        get_user_model().objects.create_user(payload['email'], password='pw')
+        self.run_on_commit()
+
+        first = self.client.post(self.url, data=payload)
+        second = self.client.post(self.url, data=payload)
+
+        self.assertEqual(first.status_code, second.status_code)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(Confirmation.objects.count(), 1)
+        self.assertEqual(Email.objects.count(), 1)
+
 
 @test.override_settings(EMAIL_BACKEND=EMAIL_BACKEND)
 class RestorePasswordChangeTest(CompositeDocstringTestCase):
@@ -251,7 +434,9 @@ class RestorePasswordChangeTest(CompositeDocstringTestCase):
             email='test@mail.com', password='pass'
         )
         payload = {'email': user.email, 'password': 'password'}
-        payload['code'] = Confirmation.objects.create(user=user).code
+        payload['code'] = Confirmation.objects.create(
+            user=user, purpose=Confirmation.RESTORE_PASSWORD
+        ).code
 
         response = self.client.post(self.url, data=payload)
         user.refresh_from_db()
@@ -298,6 +483,20 @@ class ChangePasswordTest(CompositeDocstringTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(self.user.check_password(payload['password']))
 
+    @test.override_settings(PASSWORD_HASHERS=OUTDATED_HASHERS)
+    def test_outdated_hash(self):
+        """Success with current password hashed by outdated hasher."""
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            password=hashers.make_password('pass', None, 'md5')
+        )
+        payload = {'current_password': 'pass', 'password': 'password'}
+
+        response = self.client.post(self.url, data=payload)
+        self.user.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.user.check_password(payload['password']))
+
 
 class AuthenticationTest(CompositeDocstringTestCase):
 
@@ -356,6 +555,128 @@ class AuthenticationTest(CompositeDocstringTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('token', data)
 
+    def test_email_case(self):
+        """Email in other case."""
+        payload = {'email': 'TEST@email.com', 'password': 'pass'}
+        get_user_model().objects.create_user(
+            'test@email.com', password=payload['password'], is_active=True
+        )
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_single_query(self):
+        """Single query for user with token."""
+        payload = {'email': 'test@email.com', 'password': 'pass'}
+        user = get_user_model().objects.create_user(
+            payload['email'], password=payload['password'], is_active=True
+        )
+        token = Token.objects.create(user=user)
+
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, data=payload)
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['token'], token.key)
+
+    @test.override_settings(PASSWORD_HASHERS=OUTDATED_HASHERS)
+    def test_upgrade_password_hash(self):
+        """Upgrade outdated password hash."""
+        payload = {'email': 'test@email.com', 'password': 'pass'}
+        user = get_user_model().objects.create_user(
+            payload['email'], password=payload['password'], is_active=True
+        )
+        get_user_model().objects.filter(pk=user.pk).update(
+            password=hashers.make_password(payload['password'], None, 'md5')
+        )
+
+        response = self.client.post(self.url, data=payload)
+        user.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            hashers.identify_hasher(user.password).algorithm,
+            hashers.get_hasher().algorithm
+        )
+        self.assertTrue(user.check_password(payload['password']))
+
+
+@test.override_settings(AUTH_TOKEN_MODE='signed')
+class SignedTokenTest(CompositeDocstringTestCase):
+
+    """Test signed token"""
+
+    url = reverse('api:{}:profile'.format(VERSION))
+
+    def setUp(self):
+        """Setup tests."""
+        cache.clear()
+        token_cache.local.clear()
+        denylist.local.clear()
+
+        payload = {'email': 'test@email.com', 'password': 'pass'}
+        self.user = get_user_model().objects.create_user(
+            payload['email'], password=payload['password'], is_active=True
+        )
+        response = APIClient().post(
+            reverse('api:{}:authentication'.format(VERSION)), data=payload
+        )
+        self.token = json.loads(response.content)['token']
+        self.client = APIClient(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_issue(self):
+        """Issue token without database token."""
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_authenticate(self):
+        """Authenticate without queries."""
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_forged(self):
+        """Forged token rejected."""
+        client = APIClient(HTTP_AUTHORIZATION='Token ' + self.token + 'x')
+
+        response = client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_on_password_change(self):
+        """Token revoked after password change."""
+        self.user.set_password('password')
+        self.user.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_without_denylist(self):
+        """Token revoked after password change and cache loss."""
+        self.user.set_password('password')
+        self.user.save()
+        cache.clear()
+        token_cache.local.clear()
+        denylist.local.clear()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_database_token(self):
+        """Database token accepted."""
+        token = Token.objects.create(user=self.user).key
+        client = APIClient(HTTP_AUTHORIZATION='Token ' + token)
+
+        response = client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 
 class ProfileTest(CompositeDocstringTestCase):
 
@@ -394,3 +715,732 @@ class ProfileTest(CompositeDocstringTestCase):
 
         self.assertEqual(self.user.name, payload['name'])
         self.assertEqual(self.user.surname, payload['surname'])
+
+    def test_not_modified(self):
+        """Not modified profile."""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_modified(self):
+        """Modified profile."""
+        etag = self.client.get(self.url)['ETag']
+        self.user.name = 'name'
+        self.user.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_update_email(self):
+        """Update email."""
+        payload = {'email': 'new@email.com'}
+
+        response = self.client.put(self.url, data=payload)
+        self.user.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.user.email, payload['email'])
+
+    def test_update_outdated(self):
+        """Update outdated profile."""
+        etag = self.client.get(self.url)['ETag']
+        self.user.name = 'other'
+        self.user.save()
+
+        response = self.client.put(
+            self.url, data={'name': 'name'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(
+            response.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+
+    def test_update_outdated_cached(self):
+        """Update profile outdated behind cached user."""
+        etag = self.client.get(self.url)['ETag']
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            name='other', updated=self.user.updated + datetime.timedelta(1)
+        )
+
+        response = self.client.put(
+            self.url, data={'name': 'name'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(
+            response.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+
+    def test_update_current(self):
+        """Update current profile."""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.put(
+            self.url, data={'name': 'name'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cached_authentication(self):
+        """Repeat request authenticated without queries."""
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deactivated_user(self):
+        """Cached token of deactivated user rejected."""
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token(self):
+        """Cached deleted token rejected."""
+        self.client.get(self.url)
+        Token.objects.filter(key=self.token).delete()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DeviceTest(CompositeDocstringTestCase):
+
+    """Test device registration"""
+
+    url = '/api/{}/device/apns'.format(VERSION)
+    gcm_url = '/api/{}/device/gcm'.format(VERSION)
+    bulk_url = reverse('api:{}:device.bulk'.format(VERSION))
+    registration_id = 'a' * 64
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com', password='pass', is_active=True
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.client = APIClient(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_invalid(self):
+        """Invalid registration id."""
+        response = self.client.post(self.url, data={'registration_id': 'a'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_register(self):
+        """Register new device."""
+        payload = {'registration_id': self.registration_id}
+
+        response = self.client.post(self.url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            APNSDevice.objects.filter(
+                registration_id=self.registration_id, user=self.user
+            ).exists()
+        )
+
+    def test_register_gcm(self):
+        """Register new GCM device within query budget."""
+        payload = {'registration_id': 'gcm', 'device_id': '0x1f'}
+
+        response = self.client.post(self.gcm_url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            GCMDevice.objects.get(registration_id='gcm', user=self.user)
+            .device_id, 31
+        )
+
+    def test_reassign(self):
+        """Reassign existing device to current user."""
+        other = get_user_model().objects.create_user(
+            email='other@email.com', password='pass', is_active=True
+        )
+        APNSDevice.objects.create(
+            registration_id=self.registration_id, user=other, active=False
+        )
+        payload = {'registration_id': self.registration_id, 'name': 'Phone'}
+
+        response = self.client.post(self.url, data=payload)
+        device = APNSDevice.objects.get(registration_id=self.registration_id)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(device.user, self.user)
+        self.assertEqual(device.name, payload['name'])
+        self.assertTrue(device.active)
+
+    def test_bulk(self):
+        """Register many devices."""
+        APNSDevice.objects.create(registration_id=self.registration_id)
+        payload = {
+            'apns': [
+                {'registration_id': self.registration_id},
+                {'registration_id': 'b' * 64},
+            ],
+            'gcm': [{'registration_id': 'gcm'}, {'registration_id': 'gcm'}],
+        }
+
+        response = self.client.post(self.bulk_url, data=payload)
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['apns'], {'created': 1, 'updated': 1})
+        self.assertEqual(data['gcm'], {'created': 1, 'updated': 0})
+        self.assertEqual(APNSDevice.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(GCMDevice.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_concurrent(self):
+        """Count device inserted concurrently as updated."""
+        APNSDevice.objects.create(registration_id=self.registration_id)
+        serializer = SERIALIZERS.APNSDeviceSerializer
+        save_many = serializer.save_many
+        calls = []
+
+        def stale_save_many(self, items, existing, user):
+            # First lookup misses device inserted by concurrent request.
+            stale = not calls
+            calls.append(existing)
+            return save_many(self, items, set() if stale else existing, user)
+
+        serializer.save_many = stale_save_many
+        self.addCleanup(delattr, serializer, 'save_many')
+        payload = {'apns': [
+            {'registration_id': self.registration_id},
+            {'registration_id': 'b' * 64},
+        ]}
+
+        response = self.client.post(self.bulk_url, data=payload)
+        data = json.loads(response.content)
+
+        self.assertEqual(data['apns'], {'created': 1, 'updated': 1})
+        self.assertEqual(APNSDevice.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_update_fields(self):
+        """Update name and device id of registered devices."""
+        GCMDevice.objects.bulk_create([
+            GCMDevice(registration_id='gcm1', name='Old'),
+            GCMDevice(registration_id='gcm2', device_id=1),
+        ])
+        payload = {'gcm': [
+            {'registration_id': 'gcm1', 'name': 'Phone', 'device_id': '0x1f'},
+            {'registration_id': 'gcm2', 'name': 'Tablet'},
+        ]}
+
+        response = self.client.post(self.bulk_url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(GCMDevice.objects.values_list(
+                'registration_id', 'name', 'device_id', 'user'
+            )),
+            {('gcm1', 'Phone', 31, self.user.pk),
+             ('gcm2', 'Tablet', 1, self.user.pk)}
+        )
+
+    def test_bulk_update_many(self):
+        """Update devices with distinct values within query budget."""
+        APNSDevice.objects.create(registration_id=self.registration_id)
+        GCMDevice.objects.bulk_create([
+            GCMDevice(registration_id='gcm{}'.format(i)) for i in range(5)
+        ])
+        payload = {
+            'apns': [
+                {'registration_id': self.registration_id, 'name': 'Old'},
+                {'registration_id': 'b' * 64},
+            ],
+            'gcm': [
+                {'registration_id': 'gcm{}'.format(i), 'name': str(i)}
+                for i in range(6)
+            ],
+        }
+
+        response = self.client.post(self.bulk_url, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(GCMDevice.objects.values_list('registration_id', 'name')),
+            dict(('gcm{}'.format(i), str(i)) for i in range(6))
+        )
+        self.assertEqual(
+            APNSDevice.objects.get(registration_id=self.registration_id)
+            .name, 'Old'
+        )
+
+
+class UserExportTest(CompositeDocstringTestCase):
+
+    """Test users export"""
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com', password='pass', is_active=True,
+            is_staff=True, name=u'Тест'
+        )
+        for i in range(3):
+            get_user_model().objects.create_user(
+                email='user{}@email.com'.format(i), password='pass'
+            )
+        self.token = Token.objects.create(user=self.user).key
+        self.client = APIClient(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def url(self, kind):
+        return reverse(
+            'api:{}:users.export'.format(VERSION), kwargs={'kind': kind}
+        )
+
+    def test_forbidden(self):
+        """Not staff user."""
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.get(self.url('csv'))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_csv(self):
+        """Export CSV."""
+        response = self.client.get(self.url('csv'))
+        lines = b''.join(response.streaming_content).decode('utf-8')\
+            .splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].startswith('id,email'))
+        self.assertIn(u'Тест', lines[1])
+
+    def test_ndjson(self):
+        """Export NDJSON in batches."""
+        response = self.client.get(self.url('ndjson'))
+        rows = [
+            json.loads(line) for line in
+            b''.join(response.streaming_content).decode('utf-8').splitlines()
+        ]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row['email'] for row in rows],
+            list(get_user_model().objects.order_by('pk')
+                 .values_list('email', flat=True))
+        )
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                sum(1 for chunk in exports.export('ndjson', batch_size=2)), 2
+            )
+
+
+class UserListTest(CompositeDocstringTestCase):
+
+    """Test users directory"""
+
+    url = reverse('api:{}:users'.format(VERSION))
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com', password='pass', is_active=True,
+            is_staff=True, surname='B'
+        )
+        for i in range(4):
+            get_user_model().objects.create_user(
+                email='user{}@email.com'.format(i), password='pass',
+                surname='A' if i % 2 else 'C', is_active=bool(i % 2)
+            )
+        self.token = Token.objects.create(user=self.user).key
+        self.client = APIClient(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def pages(self, **params):
+        url, pages = self.url, []
+        params.setdefault('page_size', 2)
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = json.loads(response.content)
+            pages.append(data['results'])
+            url, params = data['next'], {}
+        return pages
+
+    def test_forbidden(self):
+        """Not staff user."""
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_id(self):
+        """Paginate by id."""
+        pages = self.pages()
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [user['id'] for page in pages for user in page],
+            list(get_user_model().objects.order_by('id')
+                 .values_list('id', flat=True))
+        )
+
+    def test_surname(self):
+        """Paginate by surname with ties."""
+        pages = self.pages(ordering='surname')
+
+        self.assertEqual(
+            [(user['surname'], user['id']) for page in pages for user in page],
+            list(get_user_model().objects.order_by('surname', 'id')
+                 .values_list('surname', 'id'))
+        )
+
+    def test_filter(self):
+        """Filter by flags."""
+        pages = self.pages(is_active='false')
+
+        self.assertEqual(
+            [user['email'] for page in pages for user in page],
+            ['user0@email.com', 'user2@email.com']
+        )
+        self.assertEqual(
+            self.client.get(self.url, {'is_staff': 'maybe'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_invalid_cursor(self):
+        """Invalid cursor."""
+        response = self.client.get(self.url, {'cursor': 'invalid'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor(self):
+        """Cursor with values of wrong type."""
+        for position in (['abc'], [{}], [None], [True], [[1]]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(position).encode('utf-8')
+            ).decode('ascii')
+
+            response = self.client.get(self.url, {'cursor': cursor})
+
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, position
+            )
+
+    def test_no_count(self):
+        """Page is single query without count."""
+        self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 2})
+
+        self.assertNotIn('count', json.loads(response.content))
+
+
+class JSONTest(test.SimpleTestCase):
+
+    """Test JSON renderer and parser"""
+
+    data = {
+        'created': datetime.datetime(2016, 1, 1, 12, 30, 0, 123456),
+        'id': uuid.UUID('12345678123456781234567812345678'),
+        'amount': decimal.Decimal('1.50'),
+        'detail': _('User not found'),
+        'text': u'line\u2028separator',
+        'items': [1, None, True],
+    }
+
+    def test_render(self):
+        """Render same JSON as stock renderer."""
+        content = JSONRenderer().render(self.data)
+
+        self.assertIsInstance(content, six.binary_type)
+        self.assertIn(b'\\u2028', content)
+        self.assertEqual(
+            json.loads(content.decode('utf-8')),
+            json.loads(
+                renderers.JSONRenderer().render(self.data).decode('utf-8')
+            )
+        )
+
+    def test_render_indent(self):
+        """Render indented JSON."""
+        content = JSONRenderer().render(
+            {'a': 1}, 'application/json; indent=2'
+        )
+
+        self.assertEqual(content, b'{\n  "a": 1\n}')
+
+    def test_parse(self):
+        """Parse JSON."""
+        data = parsers.JSONParser().parse(
+            six.BytesIO(u'{"name": "\u0422\u0435\u0441\u0442"}'
+                        .encode('utf-8'))
+        )
+
+        self.assertEqual(data, {'name': u'\u0422\u0435\u0441\u0442'})
+
+    def test_parse_invalid(self):
+        """Parse invalid JSON."""
+        with self.assertRaises(ParseError):
+            parsers.JSONParser().parse(six.BytesIO(b'{'))
+
+
+class CompiledSerializerTest(CompositeDocstringTestCase):
+
+    """Test compiled serializers"""
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com', password='pass', name=u'Тест',
+            is_active=True
+        )
+        self.user.last_login = None
+        APNSDevice.objects.create(registration_id='a' * 64, user=self.user)
+        GCMDevice.objects.create(
+            registration_id='gcm', device_id=255, user=self.user, name='Phone'
+        )
+
+    def assertSameRepresentation(self, serializer_class, instances):
+        stock = [
+            serializers.Serializer.to_representation(
+                serializer_class(instance), instance
+            ) for instance in instances
+        ]
+
+        self.assertEqual(
+            [serializer_class(instance).data for instance in instances], stock
+        )
+        self.assertEqual(
+            list(serializer_class(instances, many=True).data), stock
+        )
+
+    def test_user(self):
+        """Same users representation."""
+        for serializer_class in (
+            SERIALIZERS.UserSerializer, SERIALIZERS.RegistrationSerializer,
+            SERIALIZERS.UserDirectorySerializer
+        ):
+            self.assertSameRepresentation(
+                serializer_class, list(get_user_model().objects.all())
+            )
+
+    def test_devices(self):
+        """Same devices representation."""
+        self.assertSameRepresentation(
+            SERIALIZERS.APNSDeviceSerializer, list(APNSDevice.objects.all())
+        )
+        self.assertSameRepresentation(
+            SERIALIZERS.GCMDeviceSerializer, list(GCMDevice.objects.all())
+        )
+
+    def test_many(self):
+        """List serializer uses compiled plan."""
+        serializer = SERIALIZERS.UserDirectorySerializer(
+            get_user_model().objects.all(), many=True
+        )
+
+        self.assertIsInstance(serializer, compiled.CompiledListSerializer)
+        self.assertEqual(serializer.data[0]['email'], self.user.email)
+
+
+class ScopedMiddlewareTest(CompositeDocstringTestCase):
+
+    """Test scoped middleware"""
+
+    url = reverse('api:{}:profile'.format(VERSION))
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_superuser(
+            email='test@email.com', password='pass'
+        )
+
+    def test_api(self):
+        """API skips session and clickjacking middleware."""
+        self.client.force_login(self.user)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+
+    def test_views_token_authentication(self):
+        """All views authenticate by tokens only."""
+        for pattern in URLS.urlpatterns:
+            view = pattern.callback.cls
+            self.assertTrue(issubclass(view, VIEWS.BaseView), view)
+            self.assertEqual(
+                view.authentication_classes,
+                MIXINS.TokenAuthenticationMixin.authentication_classes
+            )
+
+    def test_admin(self):
+        """Admin runs full middleware."""
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('admin:index'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('X-Frame-Options', response)
+
+
+class RequestTimingTest(CompositeDocstringTestCase):
+
+    """Test request timing"""
+
+    url = reverse('api:{}:authentication'.format(VERSION))
+    metrics_url = reverse('api:{}:metrics'.format(VERSION))
+    client = APIClient()
+
+    def setUp(self):
+        """Setup tests."""
+        timing.registry.clear()
+        self.payload = {'email': 'test@email.com', 'password': 'pass'}
+        get_user_model().objects.create_superuser(**self.payload)
+
+    @test.override_settings(
+        REQUEST_TIMING={'HEADER': False, 'HISTOGRAMS': False}
+    )
+    def test_disabled(self):
+        """Disabled timing."""
+        response = self.client.post(self.url, data=self.payload)
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(timing.registry.histograms, {})
+
+    @test.override_settings(
+        REQUEST_TIMING={'HEADER': True, 'HISTOGRAMS': True}
+    )
+    def test_header(self):
+        """Timings in Server-Timing header and metrics."""
+        response = self.client.post(self.url, data=self.payload)
+        header = response['Server-Timing']
+
+        self.assertIn('hash;dur=', header)
+        self.assertIn('db;dur=', header)
+        self.assertIn('total;dur=', header)
+        self.assertRegexpMatches(header, r'queries;desc="[1-9]\d*"')
+
+        token = json.loads(response.content)['token']
+        response = self.client.get(
+            self.metrics_url, HTTP_AUTHORIZATION='Token ' + token
+        )
+        content = response.content.decode('utf-8')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'api_request_seconds_count{{endpoint="api:{}:authentication",'
+            'component="hash"}} 1'.format(VERSION), content
+        )
+        self.assertIn(
+            'api_db_queries_total{{endpoint="api:{}:authentication"}}'
+            .format(VERSION), content
+        )
+
+    def test_hashing(self):
+        """Password hashing stats in metrics."""
+        response = self.client.post(self.url, data=self.payload)
+        token = json.loads(response.content)['token']
+
+        response = self.client.get(
+            self.metrics_url, HTTP_AUTHORIZATION='Token ' + token
+        )
+        content = response.content.decode('utf-8')
+
+        self.assertRegexpMatches(
+            content, r'\npassword_hashing_completed_total [1-9]\d*\n'
+        )
+        self.assertIn('\npassword_hashing_in_flight 0\n', content)
+        self.assertIn(
+            '# TYPE password_hashing_rejected_total counter', content
+        )
+
+    def test_token_cache(self):
+        """Token cache stats in metrics."""
+        response = self.client.post(self.url, data=self.payload)
+        token = json.loads(response.content)['token']
+
+        response = self.client.get(
+            self.metrics_url, HTTP_AUTHORIZATION='Token ' + token
+        )
+        content = response.content.decode('utf-8')
+
+        for result in ('local', 'shared', 'miss'):
+            self.assertRegexpMatches(
+                content,
+                r'\nauth_token_cache_lookups_total{{result="{}"}} \d+\n'
+                .format(result)
+            )
+
+    def test_forbidden(self):
+        """Metrics for staff only."""
+        response = self.client.get(self.metrics_url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class QueryBudgetTest(CompositeDocstringTestCase):
+
+    """Test query budgets"""
+
+    url = reverse('api:{}:profile'.format(VERSION))
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com', password='pass', is_active=True
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.client = APIClient(HTTP_AUTHORIZATION='Token ' + self.token)
+
+        budget = VIEWS.ProfileView.query_budget
+        self.addCleanup(setattr, VIEWS.ProfileView, 'query_budget', budget)
+        VIEWS.ProfileView.query_budget = 0
+
+    def test_declared(self):
+        """Every endpoint declares budget."""
+        for pattern in URLS.urlpatterns:
+            self.assertIsNotNone(
+                pattern.callback.cls.query_budget, pattern.regex.pattern
+            )
+
+    @test.override_settings(QUERY_BUDGET='raise')
+    def test_raise(self):
+        """Exceeded budget raises."""
+        with self.assertRaises(MIXINS.QueryBudgetExceeded) as context:
+            self.client.get(self.url)
+
+        self.assertIn('authtoken_token', str(context.exception))
+
+    @test.override_settings(QUERY_BUDGET='warn')
+    def test_warn(self):
+        """Exceeded budget logged with SQL."""
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        MIXINS.logger.addHandler(handler)
+        self.addCleanup(MIXINS.logger.removeHandler, handler)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(records), 1)
+        self.assertIn('authtoken_token', records[0].getMessage())
+
+    @test.override_settings(QUERY_BUDGET='off')
+    def test_off(self):
+        """Budget not checked."""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
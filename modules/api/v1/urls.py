@@ -13,6 +13,11 @@ urlpatterns = [
         r'^device/gcm/?$',
         views.CustomGCMDeviceAuthorizedViewSet.as_view({'post': 'create'})
     ),
+    url(
+        r'^device/bulk/?$',
+        views.DeviceBulkView.as_view(),
+        name='device.bulk'
+    ),
 
     url(
         r'^registration$',
@@ -54,4 +59,19 @@ urlpatterns = [
         views.ProfileView.as_view(),
         name='profile'
     ),
+    url(
+        r'^users$',
+        views.UserListView.as_view(),
+        name='users'
+    ),
+    url(
+        r'^users/export\.(?P<kind>csv|ndjson)$',
+        views.UserExportView.as_view(),
+        name='users.export'
+    ),
+    url(
+        r'^metrics$',
+        views.MetricsView.as_view(),
+        name='metrics'
+    ),
 ]
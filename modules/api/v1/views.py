@@ -1,65 +1,66 @@
 # coding=utf-8
 
-from rest_framework import status, permissions
+from django.http import HttpResponse, StreamingHttpResponse
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework import generics, status, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from push_notifications.api.rest_framework import (
     APNSDeviceAuthorizedViewSet, GCMDeviceAuthorizedViewSet
 )
-from push_notifications.models import APNSDevice, GCMDevice
 
-from . import serializers, mixins
+from api import timing
+from users import exports, hashing
+from users.authentication import token_cache
 
+from . import serializers, mixins, pagination
 
-class CustomAPNSDeviceAuthorizedViewSet(APNSDeviceAuthorizedViewSet):
 
-    def create(self, request, *args, **kwargs):
-        registration_id = request.data['registration_id']
-        try:
-            APNSDevice.objects.get(registration_id=registration_id)
-        except APNSDevice.DoesNotExist:
-            response = super(CustomAPNSDeviceAuthorizedViewSet, self).create(
-                request, *args, **kwargs
-            )
+class BaseView(mixins.TokenAuthenticationMixin, mixins.QueryBudgetMixin,
+               APIView):
 
-        try:
-            device = APNSDevice.objects.get(registration_id=registration_id)
-        except APNSDevice.DoesNotExist:
-            return response
+    """Base of API v1 views, generic views and viewsets list it last."""
 
-        device.user = request.user
-        device.save()
 
-        return Response(self.serializer_class(device).data)
+class CustomAPNSDeviceAuthorizedViewSet(mixins.DeviceUpsertMixin,
+                                        APNSDeviceAuthorizedViewSet, BaseView):
 
+    serializer_class = serializers.APNSDeviceSerializer
+    query_budget = 4
 
-class CustomGCMDeviceAuthorizedViewSet(GCMDeviceAuthorizedViewSet):
 
-    def create(self, request, *args, **kwargs):
-        registration_id = request.data['registration_id']
-        try:
-            GCMDevice.objects.get(registration_id=registration_id)
-        except GCMDevice.DoesNotExist:
-            response = super(CustomGCMDeviceAuthorizedViewSet, self).create(
-                request, *args, **kwargs
-            )
+class CustomGCMDeviceAuthorizedViewSet(mixins.DeviceUpsertMixin,
+                                       GCMDeviceAuthorizedViewSet, BaseView):
+
+    serializer_class = serializers.GCMDeviceSerializer
+    query_budget = 4
 
-        try:
-            device = GCMDevice.objects.get(registration_id=registration_id)
-        except GCMDevice.DoesNotExist:
-            return response
 
-        device.user = request.user
-        device.save()
+class DeviceBulkView(mixins.SerializerViewMixin, BaseView):
 
-        return Response(self.serializer_class(device).data)
+    """Bulk devices registration."""
+
+    serializer_class = serializers.DeviceBulkSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    # Authentication, lock of user, then lookup, update and insert per
+    # device type.
+    query_budget = 8
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(user=request.user))
 
 
-class RegistrationView(mixins.SerializerViewMixin, APIView):
+class RegistrationView(mixins.SerializerViewMixin, BaseView):
 
     """Registration."""
 
     serializer_class = serializers.RegistrationSerializer
+    query_budget = 7
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -68,11 +69,12 @@ class RegistrationView(mixins.SerializerViewMixin, APIView):
         return Response(serializer.data, status.HTTP_201_CREATED)
 
 
-class ConfirmationView(mixins.SerializerViewMixin, APIView):
+class ConfirmationView(mixins.SerializerViewMixin, BaseView):
 
     """Confirmation."""
 
     serializer_class = serializers.RegistrationConfirmationSerializer
+    query_budget = 4
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -81,11 +83,12 @@ class ConfirmationView(mixins.SerializerViewMixin, APIView):
         return Response(serializer.data)
 
 
-class ReconfirmationView(mixins.SerializerViewMixin, APIView):
+class ReconfirmationView(mixins.SerializerViewMixin, BaseView):
 
     """Reconfirmation."""
 
     serializer_class = serializers.ReconfirmationSerializer
+    query_budget = 6
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -94,11 +97,12 @@ class ReconfirmationView(mixins.SerializerViewMixin, APIView):
         return Response(serializer.data)
 
 
-class RestorePasswordRequestView(mixins.SerializerViewMixin, APIView):
+class RestorePasswordRequestView(mixins.SerializerViewMixin, BaseView):
 
     """Restore password request."""
 
     serializer_class = serializers.RestorePasswordRequestSerializer
+    query_budget = 6
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -107,11 +111,12 @@ class RestorePasswordRequestView(mixins.SerializerViewMixin, APIView):
         return Response(serializer.data)
 
 
-class RestorePasswordView(mixins.SerializerViewMixin, APIView):
+class RestorePasswordView(mixins.SerializerViewMixin, BaseView):
 
     """Restore password."""
 
     serializer_class = serializers.RestorePasswordSerializer
+    query_budget = 4
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -120,11 +125,12 @@ class RestorePasswordView(mixins.SerializerViewMixin, APIView):
         return Response(serializer.data)
 
 
-class AuthenticationView(mixins.SerializerViewMixin, APIView):
+class AuthenticationView(mixins.SerializerViewMixin, BaseView):
 
     """Authentication."""
 
     serializer_class = serializers.AuthenticationSerializer
+    query_budget = 3
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -132,35 +138,141 @@ class AuthenticationView(mixins.SerializerViewMixin, APIView):
         return Response(serializer.data)
 
 
-class ProfileView(mixins.SerializerViewMixin, APIView):
+class ProfileView(mixins.ConditionalMixin, mixins.SerializerViewMixin,
+                  BaseView):
 
     """Profile."""
 
     serializer_class = serializers.UserSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    # Authentication, lock of user, email uniqueness check, update and
+    # lookup of user tokens to invalidate.
+    query_budget = {'get': 1, 'put': 5}
 
     def get(self, request):
-        serializer = self.serializer_class(request.user)
-        return Response(serializer.data)
+        etag = self.get_etag(request.user)
+        response = self.not_modified(request, etag)
+
+        if response is None:
+            serializer = self.serializer_class(request.user)
+            response = Response(serializer.data)
+            response['ETag'] = etag
+        return response
 
     def put(self, request):
-        serializer = self.serializer_class(
-            request.user, data=request.data, partial=True
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data)
+        # Authenticated user may be cached copy, row is locked and read
+        # again, so precondition is checked against saved version.
+        with transaction.atomic():
+            user = get_user_model().objects.select_for_update().get(
+                pk=request.user.pk
+            )
+            self.check_precondition(request, self.get_etag(user))
+
+            serializer = self.serializer_class(
+                user, data=request.data, partial=True
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
 
+        response = Response(serializer.data)
+        response['ETag'] = self.get_etag(user)
+        return response
 
-class ChangePasswordView(mixins.SerializerViewMixin, APIView):
+
+class ChangePasswordView(mixins.SerializerViewMixin, BaseView):
 
     """Change password."""
 
     serializer_class = serializers.ChangePasswordSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 4
 
     def post(self, request):
         serializer = self.serializer_class(request.user, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data)
+
+
+class UserListView(generics.ListAPIView, BaseView):
+
+    """Users directory, filtered by `is_active` and `is_staff`."""
+
+    FILTERS = ('is_active', 'is_staff')
+    query_budget = 2
+
+    serializer_class = serializers.UserDirectorySerializer
+    pagination_class = pagination.UserPagination
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get_queryset(self):
+        queryset = get_user_model().objects.all()
+
+        for name in self.FILTERS:
+            if name in self.request.query_params:
+                try:
+                    value = BooleanField().run_validation(
+                        self.request.query_params[name]
+                    )
+                except ValidationError as e:
+                    raise ValidationError({name: e.detail})
+                queryset = queryset.filter(**{name: value})
+
+        return queryset
+
+
+class UserExportView(BaseView):
+
+    """Users export, streamed in batches."""
+
+    permission_classes = (permissions.IsAdminUser,)
+    # Authentication only, export queries one batch of users at a time
+    # while response is streamed, after dispatch returns.
+    query_budget = 1
+
+    def get(self, request, kind):
+        response = StreamingHttpResponse(
+            exports.export(kind), content_type=exports.FORMATS[kind][1]
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="users.{}"'.format(kind)
+        return response
+
+
+class MetricsView(BaseView):
+
+    """Request timing histograms and process stats in Prometheus format."""
+
+    permission_classes = (permissions.IsAdminUser,)
+    query_budget = 1
+
+    def get_metrics(self):
+        """Stats of process wide components."""
+        stats = hashing.executor.stats()
+        return [
+            ('password_hashing_in_flight', 'gauge',
+             'Password hashing calls running or queued.', stats['in_flight']),
+            ('password_hashing_capacity', 'gauge',
+             'Password hashing workers and queue size.', stats['capacity']),
+            ('password_hashing_completed_total', 'counter',
+             'Completed password hashing calls.', stats['completed']),
+            ('password_hashing_rejected_total', 'counter',
+             'Password hashing calls rejected or timed out.',
+             stats['rejected']),
+            ('password_hashing_seconds_total', 'counter',
+             'Time spent in completed password hashing calls.', stats['time']),
+            ('password_hashing_max_seconds', 'gauge',
+             'Longest completed password hashing call.', stats['max_time']),
+            ('auth_token_cache_lookups_total', 'counter',
+             'Token cache lookups by tier which answered them.', {
+                 'result="{}"'.format(result): count
+                 for result, count in token_cache.stats().items()
+             }),
+        ]
+
+    def get(self, request):
+        return HttpResponse(
+            timing.registry.export() +
+            timing.export_metrics(self.get_metrics()),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
@@ -0,0 +1,313 @@
+# coding=utf-8
+
+"""Push notifications fan-out.
+
+Devices are streamed by primary key keyset, grouped into provider sized
+batches and sent concurrently over pooled persistent connections. Devices
+reported by provider as invalid are deactivated.
+"""
+
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from concurrent.futures import ThreadPoolExecutor
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.six.moves import http_client, queue
+from django.utils.six.moves.urllib.parse import urlsplit
+from push_notifications import apns
+from push_notifications.models import APNSDevice, GCMDevice
+from push_notifications.settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+
+class GatewayError(Exception):
+
+    """Provider rejected batch."""
+
+
+class ConnectionPool(object):
+
+    """Bounded pool of persistent connections."""
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.connections = queue.LifoQueue()
+        self.semaphore = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """Borrow connection, broken connection is closed and dropped."""
+        with self.semaphore:
+            try:
+                connection = self.connections.get_nowait()
+            except queue.Empty:
+                connection = self.factory()
+
+            try:
+                yield connection
+            except Exception:
+                connection.close()
+                raise
+
+            self.connections.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class GCMGateway(object):
+
+    """GCM HTTP JSON gateway."""
+
+    model = GCMDevice
+    INVALID = ('NotRegistered', 'InvalidRegistration')
+
+    def __init__(self, url=None, api_key=None, batch_size=None,
+                 connections=8, timeout=10):
+        parts = urlsplit(url or SETTINGS['GCM_POST_URL'])
+        connection_class = (
+            http_client.HTTPSConnection if parts.scheme == 'https'
+            else http_client.HTTPConnection
+        )
+
+        self.path = parts.path or '/'
+        self.api_key = api_key or SETTINGS.get('GCM_API_KEY')
+        self.batch_size = batch_size or SETTINGS['GCM_MAX_RECIPIENTS']
+        self.pool = ConnectionPool(
+            lambda: connection_class(parts.netloc, timeout=timeout),
+            connections
+        )
+
+    def post(self, body):
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'key={}'.format(self.api_key),
+        }
+
+        with self.pool.connection() as connection:
+            connection.request('POST', self.path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+
+        if response.status != 200:
+            raise GatewayError(response.status, content)
+
+        return json.loads(content.decode('utf-8'))
+
+    def send(self, registration_ids, message, extra=None):
+        """Send batch, returns invalid and failed registration ids."""
+        data = dict(extra or {}, message=message)
+        body = json.dumps(
+            {'registration_ids': registration_ids, 'data': data},
+            separators=(',', ':')
+        ).encode('utf-8')
+
+        try:
+            response = self.post(body)
+        except (http_client.HTTPException, socket.error):
+            # Server may close idle keep-alive connection, retry on new one.
+            response = self.post(body)
+
+        invalid, failed = [], []
+        for registration_id, result in zip(
+                registration_ids, response['results']):
+            error = result.get('error')
+            if error in self.INVALID:
+                invalid.append(registration_id)
+            elif error:
+                failed.append(registration_id)
+
+        return invalid, failed
+
+    def close(self):
+        self.pool.close()
+
+
+class APNSGateway(object):
+
+    """APNS binary protocol gateway.
+
+    Built on socket helpers of django-push-notifications 1.4, errors are
+    read only with `APNS_ERROR_TIMEOUT` set. Notification identifiers are
+    unique across batches, so late error read on pooled connection isn't
+    taken for one of next batch.
+    """
+
+    model = APNSDevice
+    INVALID_TOKEN = 8
+    IDENTIFIERS = 2 ** 32
+
+    def __init__(self, batch_size=500, connections=4):
+        if SETTINGS.get('APNS_ERROR_TIMEOUT') is None:
+            raise ImproperlyConfigured(
+                'APNSGateway requires APNS_ERROR_TIMEOUT in'
+                ' PUSH_NOTIFICATIONS_SETTINGS to detect invalid tokens.'
+            )
+
+        self.batch_size = batch_size
+        self.pool = ConnectionPool(
+            apns._apns_create_socket_to_push, connections
+        )
+        self._identifier = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, count):
+        """Reserve `count` identifiers, returns first of them."""
+        with self._lock:
+            first = self._identifier
+            self._identifier = (first + count) % self.IDENTIFIERS
+        return first
+
+    def send(self, registration_ids, message, extra=None):
+        """Send batch, returns invalid and failed registration ids.
+
+        APNS drops connection and notifications after failed one, so rest
+        of batch is resent on new connection. Error of previous batch
+        means connection was dropped before this one, so it's resent
+        whole. Broken connection is retried once.
+        """
+        invalid, failed = [], []
+        start = 0
+        retried = False
+
+        while start < len(registration_ids):
+            pending = registration_ids[start:]
+            first = self.allocate(len(pending))
+
+            try:
+                with self.pool.connection() as connection:
+                    for offset, registration_id in enumerate(pending):
+                        apns._apns_send(
+                            registration_id, message,
+                            identifier=(first + offset) % self.IDENTIFIERS,
+                            socket=connection, **(extra or {})
+                        )
+                    apns._apns_check_errors(connection)
+            except apns.APNSServerError as e:
+                offset = (e.identifier - first) % self.IDENTIFIERS
+                if offset >= len(pending):
+                    continue
+
+                if e.status == self.INVALID_TOKEN:
+                    invalid.append(pending[offset])
+                else:
+                    failed.append(pending[offset])
+                start += offset + 1
+                retried = False
+            except socket.error:
+                if retried:
+                    failed.extend(pending)
+                    break
+                retried = True
+            else:
+                break
+
+        return invalid, failed
+
+    def close(self):
+        self.pool.close()
+
+
+def iter_batches(queryset, batch_size):
+    """Stream registration ids in batches by primary key keyset."""
+    last = 0
+
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', 'registration_id')[:batch_size]
+        )
+        if not rows:
+            break
+
+        last = rows[-1][0]
+        yield [registration_id for pk, registration_id in rows]
+
+
+class FanOut(object):
+
+    """Send notification to many devices concurrently."""
+
+    PRUNE_BATCH_SIZE = 1000
+
+    def __init__(self, gateways, workers=8):
+        self.gateways = gateways
+        self.workers = workers
+        self.stats = dict.fromkeys(('batches', 'sent', 'invalid', 'failed'), 0)
+        self.invalid = dict((gateway, []) for gateway in gateways)
+        self._lock = threading.Lock()
+
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self.stats[name] += value
+
+    def _send(self, gateway, registration_ids, message, extra):
+        try:
+            invalid, failed = gateway.send(registration_ids, message, extra)
+        except Exception:
+            self._count(batches=1, failed=len(registration_ids))
+            return
+
+        with self._lock:
+            self.invalid[gateway].extend(invalid)
+
+        self._count(
+            batches=1, invalid=len(invalid), failed=len(failed),
+            sent=len(registration_ids) - len(invalid) - len(failed)
+        )
+
+    def prune(self):
+        """Deactivate devices reported as invalid.
+
+        Done in calling thread, so workers don't hold database connections.
+        """
+        for gateway, invalid in self.invalid.items():
+            for start in range(0, len(invalid), self.PRUNE_BATCH_SIZE):
+                gateway.model.objects.filter(
+                    registration_id__in=invalid[
+                        start:start + self.PRUNE_BATCH_SIZE
+                    ]
+                ).update(active=False)
+            del invalid[:]
+
+    def send(self, message, users=None, extra=None):
+        """Send message to active devices of users (all if not given).
+
+        Returns stats with throughput in notifications per second.
+        """
+        started = time.time()
+        # Bound batches in flight, so memory stays flat for any table size.
+        slots = threading.BoundedSemaphore(self.workers * 2)
+
+        def release(future):
+            slots.release()
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            for gateway in self.gateways:
+                queryset = gateway.model.objects.filter(active=True)
+                if users is not None:
+                    queryset = queryset.filter(user__in=users)
+
+                for batch in iter_batches(queryset, gateway.batch_size):
+                    slots.acquire()
+                    executor.submit(
+                        self._send, gateway, batch, message, extra
+                    ).add_done_callback(release)
+
+        self.prune()
+
+        elapsed = time.time() - started
+        stats = dict(self.stats, elapsed=elapsed)
+        stats['rate'] = stats['sent'] / elapsed if elapsed else 0
+        return stats
+
+    def close(self):
+        for gateway in self.gateways:
+            gateway.close()
@@ -0,0 +1,120 @@
+# coding=utf-8
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from push_notifications.models import APNSDevice, GCMDevice
+
+MODELS = {'apns': APNSDevice, 'gcm': GCMDevice}
+
+
+class Command(BaseCommand):
+
+    """Prune stale and duplicate push devices."""
+
+    help = (
+        'Delete inactive and duplicate devices, deactivate devices of'
+        ' deactivated users. Devices are processed by primary key in chunks,'
+        ' each chunk in own transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=sorted(MODELS), action='append',
+            help='Device model to prune, can be repeated. All by default.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Devices per chunk.'
+        )
+        parser.add_argument(
+            '--start-after', type=int, default=0,
+            help='Resume after primary key printed by interrupted run.'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to sleep between chunks.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Count devices without changing them.'
+        )
+
+    def prune(self, model, chunk, dry_run):
+        """Prune chunk of devices, returns counters.
+
+        Dry run counts same devices with selects only.
+        """
+        with transaction.atomic():
+            inactive = chunk.filter(active=False)
+
+            # Inactive rows of later chunks will be deleted, newest device
+            # is chosen among active ones.
+            newest = set(
+                model.objects.filter(
+                    active=True, user__isnull=False,
+                    device_id__in=chunk.filter(device_id__isnull=False)
+                    .values('device_id')
+                ).values('user', 'device_id').annotate(newest=Max('pk'))
+                .values_list('newest', flat=True)
+            )
+            duplicates = chunk.filter(
+                active=True, user__isnull=False, device_id__isnull=False
+            ).exclude(pk__in=newest)
+
+            orphans = chunk.filter(active=True, user__is_active=False)
+
+            if dry_run:
+                return {
+                    'deleted_inactive': inactive.count(),
+                    'deleted_duplicates': duplicates.count(),
+                    'deactivated': orphans.exclude(
+                        pk__in=duplicates.values('pk')
+                    ).count(),
+                }
+
+            deleted_inactive = inactive.delete()[0]
+            deleted_duplicates = duplicates.delete()[0]
+            deactivated = orphans.update(active=False)
+
+        return {
+            'deleted_inactive': deleted_inactive,
+            'deleted_duplicates': deleted_duplicates,
+            'deactivated': deactivated,
+        }
+
+    def handle(self, *args, **options):
+        for name in options['model'] or sorted(MODELS):
+            model = MODELS[name]
+            last = options['start_after']
+            total = dict.fromkeys(
+                ('deleted_inactive', 'deleted_duplicates', 'deactivated'), 0
+            )
+
+            while True:
+                pks = list(
+                    model.objects.filter(pk__gt=last).order_by('pk')
+                    .values_list('pk', flat=True)[:options['batch_size']]
+                )
+                if not pks:
+                    break
+
+                chunk = model.objects.filter(pk__gt=last, pk__lte=pks[-1])
+                for key, value in self.prune(
+                    model, chunk, options['dry_run']
+                ).items():
+                    total[key] += value
+                last = pks[-1]
+
+                self.stdout.write('{}: processed up to {}.'.format(name, last))
+                time.sleep(options['pause'])
+
+            self.stdout.write(
+                '{}: deleted {deleted_inactive} inactive and'
+                ' {deleted_duplicates} duplicate devices, deactivated'
+                ' {deactivated} devices of deactivated users.'.format(
+                    name, **total
+                )
+            )
@@ -0,0 +1,54 @@
+# coding=utf-8
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from notifications import fanout
+
+
+class Command(BaseCommand):
+
+    """Send push notification to users devices."""
+
+    help = 'Send push notification to devices of active users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('message')
+        parser.add_argument(
+            '--user', action='append', dest='users', type=int,
+            help='Recipient user id, can be repeated. All active by default.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Concurrently sent batches.'
+        )
+        parser.add_argument(
+            '--skip-apns', action='store_true', default=False
+        )
+        parser.add_argument(
+            '--skip-gcm', action='store_true', default=False
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(is_active=True)
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+
+        gateways = []
+        if not options['skip_apns']:
+            gateways.append(fanout.APNSGateway())
+        if not options['skip_gcm']:
+            gateways.append(fanout.GCMGateway())
+
+        engine = fanout.FanOut(gateways, workers=options['workers'])
+        try:
+            stats = engine.send(
+                options['message'], users=users.values('pk')
+            )
+        finally:
+            engine.close()
+
+        self.stdout.write(
+            'Sent {sent}, invalid {invalid}, failed {failed} in {batches}'
+            ' batches, {elapsed:.1f} s ({rate:.0f}/s).'.format(**stats)
+        )
@@ -0,0 +1,361 @@
+# coding=utf-8
+
+import json
+import socket
+import struct
+import threading
+from binascii import hexlify
+
+from django import test
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import six
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from push_notifications.models import GCMDevice
+
+from . import fanout
+
+
+class StubGCMHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Stub GCM gateway, ids starting with `invalid` are not registered.
+
+    Ids starting with `unavailable` fail with temporary error.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        results = [
+            {'error': 'NotRegistered'} if registration_id.startswith('invalid')
+            else {'error': 'Unavailable'}
+            if registration_id.startswith('unavailable')
+            else {'message_id': '1'}
+            for registration_id in payload['registration_ids']
+        ]
+        body = json.dumps({'results': results}).encode('utf-8')
+
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGCMServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """Stub GCM server handling keep-alive connections concurrently."""
+
+    daemon_threads = True
+    requests = 0
+
+
+class FanOutTest(test.TestCase):
+
+    """Test fan-out"""
+
+    def setUp(self):
+        """Setup tests."""
+        self.server = StubGCMServer(('127.0.0.1', 0), StubGCMHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.gateway = fanout.GCMGateway(
+            url='http://127.0.0.1:{}/'.format(self.server.server_port),
+            api_key='key', batch_size=10, connections=2
+        )
+        self.addCleanup(self.gateway.close)
+
+    def test_send(self):
+        """Send in batches and prune invalid devices."""
+        user = get_user_model().objects.create_user(
+            'test@email.com', password='pass', is_active=True
+        )
+        GCMDevice.objects.bulk_create(
+            [GCMDevice(registration_id='valid{}'.format(i), user=user)
+             for i in range(25)] +
+            [GCMDevice(registration_id='invalid{}'.format(i), user=user)
+             for i in range(5)] +
+            [GCMDevice(registration_id='inactive', user=user, active=False)]
+        )
+
+        stats = fanout.FanOut([self.gateway], workers=2).send('Message')
+
+        self.assertEqual(stats['sent'], 25)
+        self.assertEqual(stats['invalid'], 5)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(
+            GCMDevice.objects.filter(active=False).count(), 6
+        )
+
+    def test_users(self):
+        """Send to given users only."""
+        users = [
+            get_user_model().objects.create_user(
+                'test{}@email.com'.format(i), password='pass'
+            ) for i in range(2)
+        ]
+        for user in users:
+            GCMDevice.objects.create(registration_id=user.email, user=user)
+
+        stats = fanout.FanOut([self.gateway]).send(
+            'Message', users=[users[0].pk]
+        )
+
+        self.assertEqual(stats['sent'], 1)
+
+    def test_failed(self):
+        """Count failed notifications apart from sent."""
+        GCMDevice.objects.bulk_create([
+            GCMDevice(registration_id='valid'),
+            GCMDevice(registration_id='unavailable'),
+        ])
+
+        stats = fanout.FanOut([self.gateway]).send('Message')
+
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['invalid'], 0)
+        self.assertEqual(GCMDevice.objects.filter(active=False).count(), 0)
+
+
+class StubAPNSSocket(object):
+
+    """Stub APNS connection, reports first invalid token written.
+
+    Error of previous batch is reported by `pending` identifier, `broken`
+    connection fails on write.
+    """
+
+    def __init__(self, invalid, connections, status=8, pending=None,
+                 broken=False):
+        self.invalid = invalid
+        self.status = status
+        self.pending = pending
+        self.broken = broken
+        self.written = []
+        self.timeout = None
+        connections.append(self)
+
+    def write(self, frame):
+        if self.broken:
+            raise socket.error('Connection reset by peer')
+
+        # |COMMAND|FRAME-LEN|{token}|{payload}|{id:4}|...
+        length = struct.unpack('!H', frame[41:43])[0]
+        identifier = struct.unpack('!I', frame[46 + length:50 + length])[0]
+        self.written.append((hexlify(frame[8:40]).decode(), identifier))
+
+    def recv(self, size):
+        if self.pending is not None:
+            return struct.pack('!BBI', 8, 8, self.pending)
+        for token, identifier in self.written:
+            if token in self.invalid:
+                return struct.pack('!BBI', 8, self.status, identifier)
+        return b''
+
+    def gettimeout(self):
+        return self.timeout
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def close(self):
+        pass
+
+
+class APNSGatewayTest(test.TestCase):
+
+    """Test APNS gateway"""
+
+    def setUp(self):
+        """Setup tests."""
+        self.tokens = ['{:064x}'.format(i) for i in range(5)]
+        self.connections = []
+        self.gateway = fanout.APNSGateway(connections=1)
+
+    def stub(self, invalid=(), **options):
+        """Use stub connections, first one with given options."""
+        def factory():
+            return StubAPNSSocket(
+                set(invalid), self.connections,
+                **({} if self.connections else options)
+            )
+
+        self.gateway.pool = fanout.ConnectionPool(factory, 1)
+
+    def test_send(self):
+        """Report invalid token and resend rest of batch."""
+        self.stub([self.tokens[2]])
+
+        invalid, failed = self.gateway.send(self.tokens, 'Message')
+
+        self.assertEqual(invalid, [self.tokens[2]])
+        self.assertEqual(failed, [])
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(
+            [token for token, identifier in self.connections[1].written],
+            self.tokens[3:]
+        )
+        self.assertEqual(self.connections[0].timeout, None)
+
+    def test_failed(self):
+        """Report failed notification apart from invalid one."""
+        self.stub([self.tokens[2]], status=10)
+
+        invalid, failed = self.gateway.send(self.tokens, 'Message')
+
+        self.assertEqual(invalid, [])
+        self.assertEqual(failed, [self.tokens[2]])
+
+    def test_unique_identifiers(self):
+        """Identifiers are unique across batches."""
+        self.stub()
+
+        self.gateway.send(self.tokens[:2], 'Message')
+        self.gateway.send(self.tokens[2:], 'Message')
+
+        self.assertEqual(
+            [identifier for token, identifier in self.connections[0].written],
+            list(range(5))
+        )
+
+    def test_previous_batch_error(self):
+        """Resend batch after error of previous batch."""
+        self.stub(pending=self.gateway.allocate(10))
+
+        invalid, failed = self.gateway.send(self.tokens, 'Message')
+
+        self.assertEqual((invalid, failed), ([], []))
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(
+            [token for token, identifier in self.connections[1].written],
+            self.tokens
+        )
+
+    def test_broken_connection(self):
+        """Retry on new connection once."""
+        self.stub(broken=True)
+
+        invalid, failed = self.gateway.send(self.tokens, 'Message')
+
+        self.assertEqual((invalid, failed), ([], []))
+        self.assertEqual(len(self.connections), 2)
+
+        self.connections = []
+        self.gateway.pool = fanout.ConnectionPool(
+            lambda: StubAPNSSocket(set(), self.connections, broken=True), 1
+        )
+
+        invalid, failed = self.gateway.send(self.tokens, 'Message')
+
+        self.assertEqual((invalid, failed), ([], self.tokens))
+        self.assertEqual(len(self.connections), 2)
+
+    def test_error_timeout_required(self):
+        """Error timeout is required."""
+        timeout = fanout.SETTINGS['APNS_ERROR_TIMEOUT']
+        fanout.SETTINGS['APNS_ERROR_TIMEOUT'] = None
+        self.addCleanup(
+            fanout.SETTINGS.__setitem__, 'APNS_ERROR_TIMEOUT', timeout
+        )
+
+        with self.assertRaises(ImproperlyConfigured):
+            fanout.APNSGateway()
+
+
+class PruneDevicesTest(test.TestCase):
+
+    """Test devices pruning"""
+
+    def setUp(self):
+        """Setup tests."""
+        self.user = get_user_model().objects.create_user(
+            'test@email.com', password='pass', is_active=True
+        )
+        self.inactive_user = get_user_model().objects.create_user(
+            'inactive@email.com', password='pass'
+        )
+        GCMDevice.objects.bulk_create([
+            GCMDevice(registration_id='active', user=self.user, device_id=1),
+            GCMDevice(registration_id='inactive', active=False),
+            GCMDevice(registration_id='old', user=self.user, device_id=2),
+            GCMDevice(registration_id='new', user=self.user, device_id=2),
+            GCMDevice(registration_id='orphan', user=self.inactive_user),
+        ])
+
+    def test_prune(self):
+        """Prune devices in chunks."""
+        call_command(
+            'clean_devices', model=['gcm'], batch_size=2,
+            stdout=six.StringIO()
+        )
+
+        self.assertEqual(
+            set(GCMDevice.objects.values_list('registration_id', 'active')),
+            {('active', True), ('new', True), ('orphan', False)}
+        )
+
+    def test_inactive_duplicate(self):
+        """Keep active device duplicated by newer inactive one."""
+        GCMDevice.objects.create(
+            registration_id='stale', user=self.user, device_id=1,
+            active=False
+        )
+
+        call_command(
+            'clean_devices', model=['gcm'], batch_size=1,
+            stdout=six.StringIO()
+        )
+
+        self.assertTrue(
+            GCMDevice.objects.filter(registration_id='active').exists()
+        )
+        self.assertFalse(
+            GCMDevice.objects.filter(registration_id='stale').exists()
+        )
+
+    def test_dry_run(self):
+        """Dry run counts devices with selects only."""
+        stdout = six.StringIO()
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                'clean_devices', model=['gcm'], dry_run=True, batch_size=2,
+                stdout=stdout
+            )
+
+        self.assertEqual(GCMDevice.objects.count(), 5)
+        self.assertEqual(
+            [query['sql'] for query in queries.captured_queries
+             if not query['sql'].startswith(('SELECT', 'SAVEPOINT',
+                                             'RELEASE SAVEPOINT'))],
+            []
+        )
+
+        output = six.StringIO()
+        call_command(
+            'clean_devices', model=['gcm'], batch_size=2, stdout=output
+        )
+
+        self.assertEqual(
+            stdout.getvalue().splitlines()[-1],
+            output.getvalue().splitlines()[-1]
+        )
+        self.assertIn(
+            'deleted 1 inactive and 1 duplicate devices, deactivated 1',
+            stdout.getvalue()
+        )
@@ -1,12 +1,46 @@
 # coding=utf-8
 
 from django.contrib import admin
-from django.utils.translation import ugettext_lazy as _
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext_lazy as _, ungettext
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
 from . import models, forms
 
 
+class EstimatedCountPaginator(Paginator):
+
+    """Paginator using planner estimate for large unfiltered tables."""
+
+    # Exact count is used below this number of rows.
+    ESTIMATE_THRESHOLD = 10000
+
+    def estimate(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+
+        return int(row[0]) if row else None
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+            return estimate
+        return super(EstimatedCountPaginator, self).count
+
+
 class UserAdmin(BaseUserAdmin):
 
     """User model admin interface."""
@@ -16,9 +50,12 @@ class UserAdmin(BaseUserAdmin):
 
     list_display = ('email', 'name', 'surname')
     list_filter = ('is_staff', 'is_active', 'is_superuser')
-    search_fields = ('email', 'phone', 'surname', 'specialty')
+    search_fields = tuple('^' + field for field in models.User.SEARCH_FIELDS)
     ordering = ('email',)
     filter_horizontal = tuple()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('activate', 'deactivate')
 
     fieldsets = (
         (_('Personal information'), {
@@ -42,4 +79,21 @@ class UserAdmin(BaseUserAdmin):
         """Has module permission."""
         return request.user.is_superuser
 
+    def set_active(self, request, queryset, is_active):
+        updated = models.User.objects.set_active(queryset, is_active)
+        self.message_user(request, ungettext(
+            '%(count)d user was updated.', '%(count)d users were updated.',
+            updated
+        ) % {'count': updated})
+
+    def activate(self, request, queryset):
+        """Activate selected users."""
+        self.set_active(request, queryset, True)
+    activate.short_description = _('Activate selected users')
+
+    def deactivate(self, request, queryset):
+        """Deactivate selected users."""
+        self.set_active(request, queryset, False)
+    deactivate.short_description = _('Deactivate selected users')
+
 admin.site.register(models.User, UserAdmin)
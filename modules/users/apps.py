@@ -0,0 +1,16 @@
+# coding=utf-8
+
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class UsersConfig(AppConfig):
+
+    """Users application config."""
+
+    name = 'users'
+
+    def ready(self):
+        from . import signals
+
+        post_migrate.connect(signals.create_search_indexes, sender=self)
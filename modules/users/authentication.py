@@ -0,0 +1,209 @@
+# coding=utf-8
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import tokens
+
+
+class LRUCache(object):
+
+    """Thread safe in-process LRU cache with entries lifetime."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return None
+
+            if expires < time.time():
+                return None
+
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.timeout, value)
+
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TokenCache(object):
+
+    """Two tier tokens cache: in-process LRU in front of shared cache.
+
+    Local entries live for `LOCAL_TIMEOUT` seconds, it bounds staleness in
+    processes other than one that invalidated token.
+    """
+
+    PREFIX = 'auth_token:'
+
+    def __init__(self, options):
+        self.shared = caches[options['CACHE']]
+        self.timeout = options['TIMEOUT']
+        self.local = LRUCache(options['LOCAL_SIZE'], options['LOCAL_TIMEOUT'])
+        self.counters = dict.fromkeys(('local', 'shared', 'miss'), 0)
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        """Get `(user, token)` pair by token key."""
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local')
+            return value
+
+        value = self.shared.get(self.PREFIX + key)
+        if value is not None:
+            self._count('shared')
+            self.local.set(key, value)
+            return value
+
+        self._count('miss')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(self.PREFIX + key, value, self.timeout)
+
+    def invalidate(self, *keys):
+        """Drop tokens from both tiers."""
+        for key in keys:
+            self.local.delete(key)
+        self.shared.delete_many([self.PREFIX + key for key in keys])
+
+    def stats(self):
+        """Hits and misses counters."""
+        with self._lock:
+            return dict(self.counters)
+
+
+class Denylist(object):
+
+    """Minimal valid signed tokens version per user.
+
+    Versions are stored in shared cache and synced to in-process LRU every
+    `DENYLIST_SYNC` seconds.
+    """
+
+    PREFIX = 'auth_denylist:'
+    REVOKE_ALL = 2 ** 31
+
+    def __init__(self, options):
+        self.shared = caches[options['CACHE']]
+        self.timeout = options['LIFETIME']
+        self.local = LRUCache(
+            options['DENYLIST_SIZE'], options['DENYLIST_SYNC']
+        )
+
+    def get(self, user_id):
+        """Minimal valid version of user tokens."""
+        version = self.local.get(user_id)
+
+        if version is None:
+            version = self.shared.get(self.PREFIX + str(user_id), 0)
+            self.local.set(user_id, version)
+
+        return version
+
+    def set(self, user_id, version):
+        """Revoke user tokens older than version."""
+        self.local.set(user_id, version)
+        self.shared.set(self.PREFIX + str(user_id), version, self.timeout)
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE)
+denylist = Denylist(settings.AUTH_SIGNED_TOKEN)
+
+
+def signed_cache_key(user_id):
+    """Token cache key of signed tokens owner."""
+    return 'user:{}'.format(user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    """Token authentication which caches token owner."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+
+        if cached is None:
+            cached = super(
+                CachedTokenAuthentication, self
+            ).authenticate_credentials(key)
+            token_cache.set(key, cached)
+
+        user, token = cached
+        return copy.copy(user), token
+
+
+class SignedTokenAuthentication(CachedTokenAuthentication):
+
+    """Authentication by signed tokens, database tokens are accepted too."""
+
+    INVALID_TOKEN = _('Invalid token.')
+    USER_INACTIVE = _('User inactive or deleted.')
+
+    def authenticate_credentials(self, key):
+        if not tokens.is_signed(key):
+            return super(
+                SignedTokenAuthentication, self
+            ).authenticate_credentials(key)
+
+        try:
+            user_id, version = tokens.verify(key)
+        except tokens.InvalidToken:
+            raise exceptions.AuthenticationFailed(self.INVALID_TOKEN)
+
+        # Denylist is fast path only, user version is source of truth.
+        if version < denylist.get(user_id):
+            raise exceptions.AuthenticationFailed(self.INVALID_TOKEN)
+
+        cache_key = signed_cache_key(user_id)
+        user = token_cache.get(cache_key)
+
+        if user is None:
+            try:
+                user = get_user_model().objects.get(pk=user_id)
+            except get_user_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(self.USER_INACTIVE)
+            token_cache.set(cache_key, user)
+
+        if version < user.token_version:
+            raise exceptions.AuthenticationFailed(self.INVALID_TOKEN)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(self.USER_INACTIVE)
+
+        return copy.copy(user), key
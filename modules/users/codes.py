@@ -0,0 +1,61 @@
+# coding=utf-8
+
+"""Stateless confirmation codes.
+
+Code is derived by HMAC from user, purpose, time window and per-user
+counter, so it's neither stored on issue nor looked up on verify. Code is
+valid in its window and next one, counter increment invalidates all
+issued codes.
+"""
+
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils.encoding import force_bytes
+
+SALT = 'users.codes'
+WINDOWS = 2
+
+
+def window_size():
+    """Window size in seconds, code lives up to `Confirmation.LIFETIME`."""
+    from .models import Confirmation
+
+    return int(Confirmation.LIFETIME.total_seconds()) // WINDOWS
+
+
+def generate(user, purpose, window=None):
+    """Generate code for user and purpose in time window."""
+    from .models import Confirmation
+
+    if window is None:
+        window = int(time.time()) // window_size()
+
+    key = hashlib.sha256(force_bytes(SALT + settings.SECRET_KEY)).digest()
+    value = u'{}:{}:{}:{}:{}'.format(
+        user.pk, user.email, purpose, window, user.confirmation_counter
+    )
+    number = int(
+        hmac.new(key, force_bytes(value), hashlib.sha256).hexdigest(), 16
+    )
+
+    letters = Confirmation.CODE_LETTERS
+    code = []
+    for _ in range(Confirmation.CODE_LENGTH):
+        number, index = divmod(number, len(letters))
+        code.append(letters[index])
+
+    return ''.join(code)
+
+
+def verify(user, purpose, code):
+    """Check code issued in current or previous windows."""
+    window = int(time.time()) // window_size()
+
+    return any(
+        constant_time_compare(code, generate(user, purpose, window - shift))
+        for shift in range(WINDOWS)
+    )
@@ -1,13 +1,92 @@
 # coding=utf-8
 
+"""Emails rendering.
+
+Templates are loaded and compiled once per language and cached. Plain
+text part is rendered from `<template>.txt`, if there is no such template
+it's derived from rendered html.
+"""
+
+import re
+import threading
+
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist, loader
+from django.utils import translation
+from django.utils.html import strip_tags
+
+from utils.timing import timer
 
 VERIFICATION = {
-    'subject': 'Confirm your registration on {}'.format(settings.HOST),
-    'template': 'users/email/verification.html'
+    'subject': 'Confirm your registration on {host}',
+    'template': 'users/email/verification'
 }
 
 RESTORE_PASSWORD = {
-    'subject': 'Restore password on {}'.format(settings.HOST),
-    'template': 'users/email/restore_password.html'
+    'subject': 'Restore password on {host}',
+    'template': 'users/email/restore_password'
 }
+
+_templates = {}
+_lock = threading.Lock()
+
+
+@receiver(setting_changed)
+def clear_templates(setting, **kwargs):
+    """Drop compiled templates when templates settings changed."""
+    if setting in ('TEMPLATES', 'LANGUAGE_CODE'):
+        with _lock:
+            _templates.clear()
+
+
+def html_to_text(html):
+    """Plain text version of html."""
+    text = strip_tags(re.sub(r'(?i)<br\s*/?>|</p>', '\n', html))
+    return '\n'.join(
+        line.strip() for line in text.splitlines() if line.strip()
+    )
+
+
+def _load(name, language, extension):
+    try:
+        return loader.select_template([
+            '{}.{}.{}'.format(name, language, extension),
+            '{}.{}'.format(name, extension),
+        ])
+    except TemplateDoesNotExist:
+        return None
+
+
+def get_templates(name, language=None):
+    """Compiled `(html, text)` templates, text one may be None."""
+    language = language or translation.get_language() or settings.LANGUAGE_CODE
+    key = (name, language)
+
+    try:
+        return _templates[key]
+    except KeyError:
+        pass
+
+    templates = (_load(name, language, 'html'), _load(name, language, 'txt'))
+    if templates[0] is None:
+        raise TemplateDoesNotExist(name)
+
+    with _lock:
+        return _templates.setdefault(key, templates)
+
+
+def render(email, context):
+    """Render email, returns `(subject, message, html_message)`."""
+    html, text = get_templates(email['template'])
+
+    with timer('template'):
+        html_message = html.render(context)
+        message = (
+            text.render(context) if text is not None
+            else html_to_text(html_message)
+        )
+    subject = email['subject'].format(host=settings.HOST)
+
+    return subject, message, html_message
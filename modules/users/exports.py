@@ -0,0 +1,87 @@
+# coding=utf-8
+
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+
+FIELDS = ('id', 'email', 'name', 'surname', 'is_active', 'is_staff',
+          'last_login')
+BATCH_SIZE = 1000
+
+
+class Echo(object):
+
+    """File-like object returning written value."""
+
+    def write(self, value):
+        return value
+
+
+def iter_users(queryset=None, batch_size=BATCH_SIZE):
+    """Stream users values in batches by primary key keyset."""
+    if queryset is None:
+        queryset = get_user_model().objects.all()
+
+    queryset = queryset.order_by('pk').values_list(*FIELDS)
+    last = 0
+
+    while True:
+        rows = list(queryset.filter(pk__gt=last)[:batch_size])
+        if not rows:
+            break
+
+        last = rows[-1][0]
+        yield rows
+
+        if len(rows) < batch_size:
+            break
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def to_csv(batches):
+    """Serialize batches to CSV, yield encoded chunk per batch."""
+    # csv module of Python 2 writes bytes, of Python 3 text.
+    encode = (lambda chunk: chunk) if six.PY2 else \
+        (lambda chunk: chunk.encode('utf-8'))
+    writer = csv.writer(Echo())
+    yield encode(writer.writerow(FIELDS))
+
+    for rows in batches:
+        yield encode(''.join(
+            writer.writerow([_csv_value(value) for value in row])
+            for row in rows
+        ))
+
+
+def to_ndjson(batches):
+    """Serialize batches to newline delimited JSON."""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    for rows in batches:
+        chunk = u''.join(
+            encoder.encode(dict(zip(FIELDS, row))) + u'\n' for row in rows
+        )
+        yield chunk.encode('utf-8')
+
+
+FORMATS = {
+    'csv': (to_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (to_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def export(kind, queryset=None, batch_size=BATCH_SIZE):
+    """Iterate encoded chunks of users export."""
+    serialize = FORMATS[kind][0]
+    return serialize(iter_users(queryset, batch_size))
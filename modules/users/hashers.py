@@ -0,0 +1,47 @@
+# coding=utf-8
+
+"""Password hashers with cost parameters from settings.
+
+Parameters are set per algorithm in `PASSWORD_HASHER_PARAMS`, recommended
+values for current hardware are printed by `calibrate_hashers` command.
+Stored hashes with other parameters are upgraded on successful login.
+"""
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class CalibratedHasherMixin(object):
+
+    """Apply cost parameters from settings to hasher."""
+
+    def __init__(self):
+        params = getattr(settings, 'PASSWORD_HASHER_PARAMS', {})
+        for name, value in params.get(self.algorithm, {}).items():
+            setattr(self, name, value)
+
+
+class PBKDF2PasswordHasher(CalibratedHasherMixin,
+                           hashers.PBKDF2PasswordHasher):
+    pass
+
+
+class BCryptSHA256PasswordHasher(CalibratedHasherMixin,
+                                 hashers.BCryptSHA256PasswordHasher):
+    pass
+
+
+if hasattr(hashers, 'Argon2PasswordHasher'):
+    class Argon2PasswordHasher(CalibratedHasherMixin,
+                               hashers.Argon2PasswordHasher):
+        pass
+else:
+    class Argon2PasswordHasher(hashers.BasePasswordHasher):
+
+        """Placeholder on Django before 1.10, library never loads."""
+
+        algorithm = 'argon2'
+        library = 'argon2'
+
+        def _load_library(self):
+            raise ValueError('Argon2 hasher requires Django 1.10 or newer.')
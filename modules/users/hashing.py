@@ -0,0 +1,143 @@
+# coding=utf-8
+
+"""Password hashing offloaded to bounded process pool.
+
+Hashing is CPU bound and holds GIL, so under threaded WSGI server it is
+moved to worker processes. When pool and its queue are full work is
+rejected immediately with 503 instead of piling up requests.
+"""
+
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions, status
+
+from utils.timing import timer
+
+
+class HashingUnavailable(exceptions.APIException):
+
+    """Hashing pool is saturated."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Service temporarily unavailable, try again later.')
+
+
+def _check_password(password, encoded):
+    """Check password, returns `(is_correct, upgraded)` pair.
+
+    `upgraded` is password hashed with current hasher settings if stored
+    hash is outdated, otherwise None.
+    """
+    result = {'upgraded': None}
+
+    def setter(password):
+        result['upgraded'] = hashers.make_password(password)
+
+    is_correct = hashers.check_password(password, encoded, setter)
+    return is_correct, result['upgraded']
+
+
+class HashingExecutor(object):
+
+    """Bounded hashing executor.
+
+    With zero `workers` hashing is done in calling thread, metrics are
+    collected anyway.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self.capacity = workers + queue_size
+        self.semaphore = threading.BoundedSemaphore(max(self.capacity, 1))
+        self.counters = dict.fromkeys(
+            ('in_flight', 'completed', 'rejected', 'time', 'max_time'), 0
+        )
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers)
+            return self._pool
+
+    def _started(self):
+        with self._lock:
+            self.counters['in_flight'] += 1
+
+    def _finished(self, elapsed):
+        """Count finished call, `elapsed` is None for timed out one."""
+        with self._lock:
+            self.counters['in_flight'] -= 1
+            if elapsed is None:
+                return
+            self.counters['completed'] += 1
+            self.counters['time'] += elapsed
+            self.counters['max_time'] = max(self.counters['max_time'], elapsed)
+
+    def _rejected(self):
+        with self._lock:
+            self.counters['rejected'] += 1
+        raise HashingUnavailable()
+
+    def call(self, function, *args):
+        """Call function in pool, raises `HashingUnavailable` if it's full."""
+        if self.workers and not self.semaphore.acquire(False):
+            self._rejected()
+
+        self._started()
+        started = time.time()
+        timed_out = False
+        try:
+            if not self.workers:
+                return function(*args)
+
+            try:
+                future = self.pool.submit(function, *args)
+            except Exception:
+                self.semaphore.release()
+                raise
+            future.add_done_callback(lambda future: self.semaphore.release())
+            try:
+                return future.result(self.timeout)
+            except TimeoutError:
+                timed_out = True
+        finally:
+            self._finished(None if timed_out else time.time() - started)
+
+        self._rejected()
+
+    def stats(self):
+        """Queue depth and hashing latency metrics."""
+        with self._lock:
+            stats = dict(self.counters)
+
+        stats['capacity'] = self.capacity
+        stats['avg_time'] = (
+            stats['time'] / stats['completed'] if stats['completed'] else 0
+        )
+        return stats
+
+
+executor = HashingExecutor(**{
+    key.lower(): value for key, value in settings.PASSWORD_HASHING.items()
+})
+
+
+def make_password(password):
+    """Hash password."""
+    with timer('hash'):
+        return executor.call(hashers.make_password, password)
+
+
+def check_password(password, encoded):
+    """Check password, returns `(is_correct, upgraded)` pair."""
+    with timer('hash'):
+        return executor.call(_check_password, password, encoded)
@@ -0,0 +1,106 @@
+# coding=utf-8
+
+import math
+import pprint
+import time
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+
+PASSWORD = 'calibration password'
+
+# Cost parameter of hasher and how verify time depends on it.
+PARAMS = (
+    ('iterations', 'linear'),
+    ('time_cost', 'linear'),
+    ('rounds', 'exponential'),
+)
+
+
+class Command(BaseCommand):
+
+    """Benchmark configured password hashers."""
+
+    help = (
+        'Benchmark PASSWORD_HASHERS on current machine and recommend cost'
+        ' parameters for target verify latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', type=float, default=250,
+            help='Target verify latency in milliseconds.'
+        )
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='Verify runs per measurement.'
+        )
+
+    def measure(self, hasher, runs):
+        """Average verify time in milliseconds."""
+        encoded = hasher.encode(PASSWORD, hasher.salt())
+
+        started = time.time()
+        for _ in range(runs):
+            hasher.verify(PASSWORD, encoded)
+
+        return (time.time() - started) / runs * 1000
+
+    def recommend(self, hasher, param, scale, target, runs):
+        """Cost parameter value closest to target latency."""
+        value = getattr(hasher, param)
+        elapsed = self.measure(hasher, runs)
+
+        if scale == 'linear':
+            value = max(1, int(round(value * target / elapsed)))
+        else:
+            value = max(4, min(31, value + int(round(
+                math.log(target / elapsed, 2)
+            ))))
+
+        setattr(hasher, param, value)
+        return value, self.measure(hasher, runs)
+
+    def handle(self, *args, **options):
+        recommended = {}
+
+        for hasher in hashers.get_hashers():
+            hasher = type(hasher)()
+
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError:
+                self.stdout.write(
+                    '{}: library not installed, skipped.'.format(
+                        hasher.algorithm
+                    )
+                )
+                continue
+
+            for param, scale in PARAMS:
+                if hasattr(hasher, param):
+                    break
+            else:
+                self.stdout.write('{}: {:.1f} ms, no cost parameter.'.format(
+                    hasher.algorithm, self.measure(hasher, options['runs'])
+                ))
+                continue
+
+            current = getattr(hasher, param)
+            elapsed = self.measure(hasher, options['runs'])
+            value, expected = self.recommend(
+                hasher, param, scale, options['target'], options['runs']
+            )
+            recommended[hasher.algorithm] = {param: value}
+
+            self.stdout.write(
+                '{}: {}={} {:.1f} ms, recommended {}={} {:.1f} ms.'.format(
+                    hasher.algorithm, param, current, elapsed,
+                    param, value, expected
+                )
+            )
+
+        self.stdout.write('\nPASSWORD_HASHER_PARAMS = {}'.format(
+            pprint.pformat(recommended)
+        ))
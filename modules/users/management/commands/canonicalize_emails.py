@@ -0,0 +1,95 @@
+# coding=utf-8
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+
+    """Case fold stored emails."""
+
+    help = (
+        'Rewrite emails to canonical stripped lower case form, walking users'
+        ' by primary key in batches. Users whose canonical email is already'
+        ' taken are reported as duplicates and left unchanged.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Users scanned per query.'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds to sleep between batches.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Report changes without writing them.'
+        )
+
+    def canonicalize(self, pk, email, dry_run):
+        """Update single user, returns False on duplicate."""
+        model = get_user_model()
+        canonical = model.objects.normalize_email(email)
+
+        if model.objects.filter(email=canonical).exclude(pk=pk).exists():
+            return False
+        if dry_run:
+            return True
+
+        try:
+            with transaction.atomic():
+                model.objects.filter(pk=pk, email=email).update(
+                    email=canonical, updated=timezone.now()
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    def handle(self, *args, **options):
+        model = get_user_model()
+        queryset = model.objects.order_by('pk')
+        last, updated, duplicates = 0, 0, []
+
+        while True:
+            pks = list(
+                queryset.filter(pk__gt=last).values_list('pk', flat=True)
+                [:options['batch_size']]
+            )
+            if not pks:
+                break
+            last = pks[-1]
+
+            # Compared with normalize_email itself, SQL functions differ
+            # in whitespace stripping.
+            mismatched = [
+                (pk, email) for pk, email in queryset.filter(
+                    pk__gte=pks[0], pk__lte=last
+                ).values_list('pk', 'email')
+                if email != model.objects.normalize_email(email)
+            ]
+
+            for pk, email in mismatched:
+                if self.canonicalize(pk, email, options['dry_run']):
+                    updated += 1
+                else:
+                    duplicates.append((pk, email))
+
+            if len(pks) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+
+        for pk, email in duplicates:
+            self.stderr.write(
+                'Duplicate: user {} <{}> clashes with existing account,'
+                ' merge manually.'.format(pk, email)
+            )
+        self.stdout.write('{} {} emails, {} duplicates.'.format(
+            'Found' if options['dry_run'] else 'Canonicalized',
+            updated, len(duplicates)
+        ))
@@ -0,0 +1,85 @@
+# coding=utf-8
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from users.models import Confirmation
+
+# Heap tuple header and item pointer, used when size can't be measured.
+ROW_OVERHEAD = 28
+
+
+class Command(BaseCommand):
+
+    """Delete expired confirmations."""
+
+    help = (
+        'Delete expired confirmations in bounded batches with pause between'
+        ' them, so table is not locked for long. Run it periodically.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Confirmations deleted per statement.'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds to sleep between batches.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Count expired confirmations without deleting them.'
+        )
+
+    def row_size(self):
+        """Average row size in bytes, measured on PostgreSQL."""
+        connection = connections[Confirmation.objects.db]
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT avg(pg_column_size(t.*)) FROM'
+                    ' (SELECT * FROM {} LIMIT 1000) t'.format(
+                        connection.ops.quote_name(
+                            Confirmation._meta.db_table
+                        )
+                    )
+                )
+                size = cursor.fetchone()[0]
+            if size:
+                return int(size)
+
+        return ROW_OVERHEAD + 8 + 4 + 8 + Confirmation.CODE_LENGTH
+
+    def handle(self, *args, **options):
+        expired = Confirmation.objects.expired()
+
+        if options['dry_run']:
+            deleted = expired.count()
+        else:
+            deleted = 0
+            while True:
+                pks = list(
+                    expired.values_list('pk', flat=True)
+                    [:options['batch_size']]
+                )
+                if not pks:
+                    break
+
+                deleted += Confirmation.objects.filter(
+                    pk__in=pks
+                ).delete()[0]
+
+                if len(pks) < options['batch_size']:
+                    break
+                time.sleep(options['pause'])
+
+        self.stdout.write(
+            '{} {} expired confirmations, ~{} bytes reclaimed.'.format(
+                'Found' if options['dry_run'] else 'Deleted',
+                deleted, deleted * self.row_size()
+            )
+        )
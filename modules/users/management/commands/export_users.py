@@ -0,0 +1,46 @@
+# coding=utf-8
+
+import io
+
+from django.core.management.base import BaseCommand
+
+from users import exports
+
+
+class Command(BaseCommand):
+
+    """Export users."""
+
+    help = (
+        'Export users as CSV or NDJSON, walking table by primary key in'
+        ' batches so memory stays flat regardless of table size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=sorted(exports.FORMATS), default='csv',
+            help='Output format.'
+        )
+        parser.add_argument(
+            '--output', default='-',
+            help='Output file, standard output by default.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=exports.BATCH_SIZE,
+            help='Users fetched per query.'
+        )
+
+    def handle(self, *args, **options):
+        chunks = exports.export(
+            options['format'], batch_size=options['batch_size']
+        )
+
+        if options['output'] == '-':
+            # Chunks end on row boundaries, so each one decodes alone.
+            for chunk in chunks:
+                self.stdout.write(chunk.decode('utf-8'), ending='')
+            self.stdout.flush()
+        else:
+            with io.open(options['output'], 'wb') as stream:
+                for chunk in chunks:
+                    stream.write(chunk)
@@ -0,0 +1,198 @@
+# coding=utf-8
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from itertools import islice
+
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth import get_user_model, hashers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import six
+
+FIELDS = ('email', 'name', 'surname')
+
+
+def read_csv(stream):
+    if six.PY2:
+        for row in csv.DictReader(stream):
+            yield dict(
+                (key, value.decode('utf-8')) for key, value in row.items()
+                if value is not None
+            )
+    else:
+        for row in csv.DictReader(stream):
+            yield row
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def open_input(path, reader):
+    """Open input, csv module of Python 2 reads bytes."""
+    if six.PY2 and reader is read_csv:
+        return open(path, 'rb')
+    return io.open(path, encoding='utf-8')
+
+
+class Command(BaseCommand):
+
+    """Import users."""
+
+    help = (
+        'Import users from CSV or JSONL file with email, name, surname and'
+        ' password or already hashed password_hash columns.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='Input format, detected by extension by default.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Users inserted per statement.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help='Password hashing processes, 0 hashes in main process.'
+        )
+        parser.add_argument(
+            '--inactive', action='store_true', default=False,
+            help='Import users as not activated.'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File with number of processed records, used to resume.'
+        )
+
+    def read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    def write_checkpoint(self, path, processed):
+        if path:
+            with open(path + '.tmp', 'w') as checkpoint:
+                checkpoint.write(str(processed))
+            os.rename(path + '.tmp', path)
+
+    def build(self, records, hash_passwords, is_active):
+        """Users of batch records not existing in database."""
+        model = get_user_model()
+        users = {}
+
+        for record in records:
+            email = model.objects.normalize_email(record.get('email') or '')
+            if email and email not in users:
+                users[email] = record
+
+        existing = set(
+            model.objects.filter(email__in=list(users))
+            .values_list('email', flat=True)
+        )
+        for email in existing:
+            del users[email]
+
+        plain = [
+            email for email, record in users.items()
+            if not record.get('password_hash')
+        ]
+        hashed = dict(zip(plain, hash_passwords(
+            users[email].get('password') for email in plain
+        )))
+
+        return [
+            model(
+                email=email, name=record.get('name') or '',
+                surname=record.get('surname') or '', is_active=is_active,
+                password=record.get('password_hash') or hashed[email]
+            ) for email, record in users.items()
+        ]
+
+    def insert(self, users):
+        """Insert users, returns number of inserted."""
+        try:
+            with transaction.atomic():
+                get_user_model().objects.bulk_create(users)
+            return len(users)
+        except IntegrityError:
+            pass
+
+        # Some emails were inserted concurrently, insert one by one.
+        inserted = 0
+        for user in users:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                inserted += 1
+            except IntegrityError:
+                pass
+        return inserted
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(
+            options['format'] or os.path.splitext(path)[1].lstrip('.')
+        )
+        if reader is None:
+            raise CommandError('Unknown format, use --format.')
+
+        pool = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(options['workers'])
+            chunksize = max(1, options['batch_size'] // options['workers'])
+
+            def hash_passwords(passwords):
+                return pool.map(
+                    hashers.make_password, passwords, chunksize=chunksize
+                )
+        else:
+            def hash_passwords(passwords):
+                return [hashers.make_password(value) for value in passwords]
+
+        processed = skipped = self.read_checkpoint(options['checkpoint'])
+        imported = 0
+        started = time.time()
+
+        try:
+            with open_input(path, reader) as stream:
+                records = islice(reader(stream), skipped, None)
+
+                while True:
+                    batch = list(islice(records, options['batch_size']))
+                    if not batch:
+                        break
+
+                    imported += self.insert(self.build(
+                        batch, hash_passwords, not options['inactive']
+                    ))
+                    processed += len(batch)
+                    self.write_checkpoint(options['checkpoint'], processed)
+
+                    self.stdout.write(
+                        'Processed {}, imported {}, {:.0f} rows/s.'.format(
+                            processed, imported,
+                            (processed - skipped) /
+                            max(time.time() - started, 1e-6)
+                        )
+                    )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        self.stdout.write('Imported {} of {} records.'.format(
+            imported, processed
+        ))
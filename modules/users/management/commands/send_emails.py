@@ -0,0 +1,47 @@
+# coding=utf-8
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import tasks
+
+
+class Command(BaseCommand):
+
+    """Deliver emails from outbox."""
+
+    help = 'Deliver queued emails in batches over single SMTP connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=tasks.BATCH_SIZE,
+            help='Emails claimed per batch.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to sleep when outbox is empty.'
+        )
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help='Deliver available emails and exit.'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+
+        try:
+            while True:
+                processed = tasks.deliver_emails(options['batch_size'])
+                total += processed
+
+                if processed:
+                    continue
+                if options['once']:
+                    break
+
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write('Processed {} emails.'.format(total))
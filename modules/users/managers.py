@@ -1,6 +1,7 @@
 # coding=utf-8
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import BaseUserManager
 from django.utils import crypto, timezone
 
@@ -9,6 +10,14 @@ class UserManager(BaseUserManager):
 
     """User model manager."""
 
+    @classmethod
+    def normalize_email(cls, email):
+        """Case fold whole address, it's canonical user identity."""
+        return (email or '').strip().lower()
+
+    def get_by_natural_key(self, username):
+        return self.get(email=self.normalize_email(username))
+
     def create(self, email, password, **kwargs):
         user = self.model(email=self.normalize_email(email), **kwargs)
         user.set_password(password)
@@ -23,22 +32,108 @@ class UserManager(BaseUserManager):
             is_staff=True, is_superuser=True, is_active=True, **kwargs
         )
 
+    def set_active(self, queryset, is_active):
+        """Activate or deactivate users with single update.
+
+        Update doesn't send signals, so cached tokens and signed tokens
+        denylist are synced here.
+        """
+        from rest_framework.authtoken.models import Token
+        from .authentication import denylist, signed_cache_key, token_cache
+
+        users = list(
+            queryset.exclude(is_active=is_active)
+            .values_list('pk', 'token_version')
+        )
+        pks = [pk for pk, version in users]
+        updated = self.filter(pk__in=pks).update(is_active=is_active)
+
+        keys = Token.objects.filter(user__in=pks).values_list('key', flat=True)
+        token_cache.invalidate(
+            *[signed_cache_key(pk) for pk in pks] + list(keys)
+        )
+        for pk, version in users:
+            denylist.set(pk, version if is_active else denylist.REVOKE_ALL)
+
+        return updated
+
 
 class ConfirmationManager(models.Manager):
 
     """Confirmation model manager."""
 
-    def create(self, user):
+    def create(self, user, purpose=None):
         from .models import Confirmation
 
         instance = Confirmation()
         instance.user = user
+        instance.purpose = purpose or Confirmation.VERIFICATION
         instance.code = self.generate_code(user)
         instance.expired = timezone.now() + Confirmation.LIFETIME
         instance.save()
 
         return instance
 
+    def issue(self, user, purpose):
+        """Issue confirmation for purpose, active one is reused.
+
+        User row is locked until end of transaction, so concurrent issues
+        for user are serialized. In `hmac` mode code is derived from user
+        state and nothing is stored, returned confirmation is not saved.
+        """
+        from .models import Confirmation, User
+        from . import codes
+
+        list(
+            User.objects.select_for_update()
+            .filter(pk=user.pk).values_list('pk', flat=True)
+        )
+
+        if settings.CONFIRMATION_MODE == 'hmac':
+            return Confirmation(
+                user=user, purpose=purpose,
+                code=codes.generate(user, purpose),
+                expired=timezone.now() + Confirmation.LIFETIME
+            )
+
+        confirmation = self.filter(
+            user=user, purpose=purpose,
+            expired__gt=timezone.now() + Confirmation.RENEW_BEFORE
+        ).order_by('-expired').first()
+
+        return confirmation or self.create(user, purpose)
+
+    def consume(self, email, code, purpose):
+        """Delete matching active confirmation, returns its user or None.
+
+        Only one of concurrent requests with same code deletes row, so
+        code is redeemed once.
+        """
+        from .models import User
+        from . import codes
+
+        email = User.objects.normalize_email(email)
+        user = User.objects.filter(email=email).first()
+
+        if settings.CONFIRMATION_MODE != 'hmac':
+            if user is None:
+                return None
+
+            deleted, _ = self.active().filter(
+                user=user, code=code, purpose=purpose
+            ).delete()
+            return user if deleted else None
+
+        if user is None or not codes.verify(user, purpose, code):
+            return None
+
+        redeemed = User.objects.filter(
+            pk=user.pk, confirmation_counter=user.confirmation_counter
+        ).update(confirmation_counter=models.F('confirmation_counter') + 1)
+        user.confirmation_counter += 1
+
+        return user if redeemed else None
+
     def generate_code(self, user, length=None, letters=None):
         """Generate unique code."""
         from .models import Confirmation
@@ -58,6 +153,47 @@ class ConfirmationManager(models.Manager):
         """Active confirmations."""
         return self.filter(expired__gt=timezone.now())
 
+    def expired(self):
+        """Expired confirmations."""
+        return self.filter(expired__lte=timezone.now())
+
     def for_user(self, user):
         """Concrete user confirmations."""
         return self.filter(user=user)
+
+
+class EmailManager(models.Manager):
+
+    """Email model manager."""
+
+    def enqueue(self, email, subject, message, html_message=''):
+        """Put email into outbox."""
+        return self.create(
+            recipient=email, subject=subject,
+            message=message, html_message=html_message
+        )
+
+    def pending(self):
+        """Emails ready for delivery, including expired claims."""
+        from .models import Email
+
+        return self.filter(
+            status__in=(Email.PENDING, Email.SENDING),
+            scheduled__lte=timezone.now()
+        )
+
+    def claim(self, limit):
+        """Lock batch of pending emails for delivery by current worker."""
+        from .models import Email
+
+        with transaction.atomic():
+            ids = list(
+                self.pending().select_for_update().order_by('scheduled')
+                .values_list('pk', flat=True)[:limit]
+            )
+            self.filter(pk__in=ids).update(
+                status=Email.SENDING,
+                scheduled=timezone.now() + Email.LOCK_TIMEOUT
+            )
+
+        return list(self.filter(pk__in=ids).order_by('pk'))
@@ -7,7 +7,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser
 from django.utils.translation import ugettext_lazy as _
 
-from . import managers
+from . import hashing, managers
 
 
 class User(AbstractBaseUser):
@@ -22,14 +22,34 @@ class User(AbstractBaseUser):
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
 
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+    updated = models.DateTimeField(auto_now=True)
+    confirmation_counter = models.PositiveIntegerField(
+        default=0, editable=False
+    )
+
     objects = managers.UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name', 'surname']
+    # Searched by case insensitive prefix, indexed on PostgreSQL.
+    SEARCH_FIELDS = ('email', 'name', 'surname')
+
+    class Meta:
+        index_together = (
+            ('is_active', 'email'), ('is_staff', 'email'), ('surname', 'id')
+        )
 
     def __unicode__(self):
         return u'{}'.format(self.email)
 
+    def clean(self):
+        self.email = User.objects.normalize_email(self.email)
+
+    def save(self, *args, **kwargs):
+        self.email = User.objects.normalize_email(self.email)
+        super(User, self).save(*args, **kwargs)
+
     def get_short_name(self):
         return u'{}'.format(self.name)
 
@@ -42,6 +62,28 @@ class User(AbstractBaseUser):
     def has_perm(self, *args, **kwargs):
         return self.is_staff
 
+    def set_password(self, raw_password):
+        """Set password and revoke signed tokens issued before."""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+        self.token_version += 1
+
+    def check_password(self, raw_password):
+        """Check password, upgrade hash if hasher settings changed.
+
+        Upgraded hash is written with single column update, without
+        signals, so signed tokens stay valid.
+        """
+        is_correct, upgraded = hashing.check_password(
+            raw_password, self.password
+        )
+
+        if is_correct and upgraded:
+            self.password = upgraded
+            User.objects.filter(pk=self.pk).update(password=upgraded)
+
+        return is_correct
+
 
 class Confirmation(models.Model):
 
@@ -51,11 +93,87 @@ class Confirmation(models.Model):
     CODE_LENGTH = 6
     CODE_LETTERS = string.digits
 
+    # Active confirmation is reused until it's about to expire.
+    RENEW_BEFORE = timezone.timedelta(days=1)
+
+    VERIFICATION = 'verification'
+    RESTORE_PASSWORD = 'restore_password'
+    PURPOSES = (
+        (VERIFICATION, _('Verification')),
+        (RESTORE_PASSWORD, _('Restore password')),
+    )
+
     user = models.ForeignKey(User, related_name='confirmations')
     code = models.CharField(max_length=32, unique=True)
-    expired = models.DateTimeField()
+    purpose = models.CharField(
+        max_length=16, choices=PURPOSES, default=VERIFICATION
+    )
+    expired = models.DateTimeField(db_index=True)
 
     objects = managers.ConfirmationManager()
 
     class Meta:
         unique_together = ('user', 'code')
+
+
+class Email(models.Model):
+
+    """Outgoing email database model."""
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, _('Pending')),
+        (SENDING, _('Sending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = timezone.timedelta(minutes=1)
+    LOCK_TIMEOUT = timezone.timedelta(minutes=10)
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    html_message = models.TextField(blank=True)
+
+    status = models.CharField(max_length=8, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    scheduled = models.DateTimeField(default=timezone.now)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    objects = managers.EmailManager()
+
+    class Meta:
+        index_together = ('status', 'scheduled')
+
+    def __unicode__(self):
+        return u'{0.subject} <{0.recipient}>'.format(self)
+
+    def delivered(self):
+        """Mark email as delivered."""
+        self.status = self.SENT
+        self.sent = timezone.now()
+        self.error = ''
+        self.save(update_fields=('status', 'sent', 'error'))
+
+    def undelivered(self, error):
+        """Mark delivery attempt as failed and schedule retry."""
+        self.attempts += 1
+        self.error = u'{}'.format(error)
+
+        if self.attempts >= self.MAX_ATTEMPTS:
+            self.status = self.FAILED
+        else:
+            self.status = self.PENDING
+            self.scheduled = timezone.now() + (
+                self.RETRY_DELAY * 2 ** (self.attempts - 1)
+            )
+
+        self.save(update_fields=('status', 'attempts', 'error', 'scheduled'))
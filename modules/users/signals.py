@@ -0,0 +1,61 @@
+# coding=utf-8
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import denylist, signed_cache_key, token_cache
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """Drop deleted token from cache."""
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Drop cached copies of changed user and sync signed tokens denylist."""
+    keys = [] if created else list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    token_cache.invalidate(signed_cache_key(instance.pk), *keys)
+
+    denylist.set(
+        instance.pk,
+        instance.token_version if instance.is_active else denylist.REVOKE_ALL
+    )
+
+
+def create_search_indexes(sender, using, **kwargs):
+    """Create indexes for case insensitive prefix search on PostgreSQL.
+
+    Django has no expression indexes, `istartswith` filters on
+    `UPPER(column::text)` so plain column index is not used.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+
+    model = get_user_model()
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        for field in model.SEARCH_FIELDS:
+            column = model._meta.get_field(field).column
+            name = '{}_{}_upper_like'.format(table, column)
+
+            cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s', [name])
+            if cursor.fetchone():
+                continue
+
+            cursor.execute(
+                'CREATE INDEX {} ON {} (UPPER({}::text) text_pattern_ops)'
+                .format(
+                    connection.ops.quote_name(name),
+                    connection.ops.quote_name(table),
+                    connection.ops.quote_name(column),
+                )
+            )
@@ -1,37 +1,107 @@
 # coding=utf-8
 
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db import transaction
+
+from utils.timing import timer
 
 from . import emails
+from .models import Email
+
+BATCH_SIZE = 100
+
+
+def send_email(email, subject, message, html_message=''):
+    """Put email into outbox, delivered later by `deliver_emails`."""
+    with timer('email'):
+        return Email.objects.enqueue(
+            email=email, subject=subject,
+            message=message, html_message=html_message
+        )
 
 
-def send_email(email, subject, message):
-    """Send email."""
-    send_mail(
-        subject=subject, message=message, html_message=message,
-        recipient_list=[email], from_email=settings.DEFAULT_FROM_EMAIL
+def throttled(confirmation):
+    """Check and mark sending of confirmation.
+
+    Confirmation of purpose is sent to user once per
+    `CONFIRMATION_RESEND_INTERVAL`. Mark is set when transaction commits,
+    so rolled back sending is retried, concurrent ones are serialized by
+    lock of user in `ConfirmationManager.issue`.
+    """
+    key = 'confirmation_sent:{0.purpose}:{0.user_id}'.format(confirmation)
+    if cache.get(key):
+        return True
+
+    transaction.on_commit(
+        lambda: cache.set(key, True, settings.CONFIRMATION_RESEND_INTERVAL)
     )
+    return False
 
 
 def send_confirmation_email(confirmation):
     """Send confirmation email."""
-    message = render_to_string(
-        emails.VERIFICATION['template'], {'code': confirmation.code}
+    if throttled(confirmation):
+        return
+
+    subject, message, html_message = emails.render(
+        emails.VERIFICATION, {'code': confirmation.code}
     )
     send_email(
-        subject=emails.VERIFICATION['subject'], message=message,
+        subject=subject, message=message, html_message=html_message,
         email=confirmation.user.email
     )
 
 
 def send_restore_password_email(confirmation):
     """Send email with instructions for restore password."""
-    message = render_to_string(
-        emails.RESTORE_PASSWORD['template'], {'code': confirmation.code}
+    if throttled(confirmation):
+        return
+
+    subject, message, html_message = emails.render(
+        emails.RESTORE_PASSWORD, {'code': confirmation.code}
     )
     send_email(
-        subject=emails.RESTORE_PASSWORD['subject'], message=message,
+        subject=subject, message=message, html_message=html_message,
         email=confirmation.user.email
     )
+
+
+def deliver_emails(batch_size=BATCH_SIZE):
+    """Deliver batch of queued emails over single connection.
+
+    Returns number of processed emails.
+    """
+    outbox = Email.objects.claim(batch_size)
+    if not outbox:
+        return 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in outbox:
+            email.undelivered(e)
+        return len(outbox)
+
+    try:
+        for email in outbox:
+            message = EmailMultiAlternatives(
+                subject=email.subject, body=email.message,
+                from_email=settings.DEFAULT_FROM_EMAIL, to=[email.recipient],
+                connection=connection
+            )
+            if email.html_message:
+                message.attach_alternative(email.html_message, 'text/html')
+
+            try:
+                message.send()
+            except Exception as e:
+                email.undelivered(e)
+            else:
+                email.delivered()
+    finally:
+        connection.close()
+
+    return len(outbox)
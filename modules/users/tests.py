@@ -0,0 +1,490 @@
+# coding=utf-8
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django import test
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.utils import six, timezone
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import denylist, token_cache
+from .models import Confirmation, Email
+from . import admin, authentication, emails, hashing, tasks
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+
+@test.override_settings(EMAIL_BACKEND=EMAIL_BACKEND)
+class DeliverEmailsTest(test.TestCase):
+
+    """Test outbox delivery"""
+
+    def test_deliver(self):
+        """Deliver pending emails."""
+        for i in range(3):
+            tasks.send_email('test{}@email.com'.format(i), 'Subject', 'Text')
+
+        call_command(
+            'send_emails', once=True, batch_size=2, stdout=six.StringIO()
+        )
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Email.objects.filter(status=Email.SENT).count(), 3)
+
+    def test_skip_scheduled(self):
+        """Skip emails scheduled for later."""
+        email = tasks.send_email('test@email.com', 'Subject', 'Text')
+        Email.objects.filter(pk=email.pk).update(
+            scheduled=timezone.now() + timezone.timedelta(minutes=1)
+        )
+
+        self.assertEqual(tasks.deliver_emails(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_retry(self):
+        """Retry failed delivery with backoff."""
+        email = tasks.send_email('test@email.com', 'Subject', 'Text')
+
+        email.undelivered('Connection refused')
+        email.refresh_from_db()
+
+        self.assertEqual(email.status, Email.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.scheduled, timezone.now())
+
+        email.attempts = Email.MAX_ATTEMPTS - 1
+        email.undelivered('Connection refused')
+        email.refresh_from_db()
+
+        self.assertEqual(email.status, Email.FAILED)
+
+
+class ConfirmationThrottleTest(test.TransactionTestCase):
+
+    """Test confirmation resend throttling"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com', password='pass'
+        )
+
+    def send(self, purpose=Confirmation.VERIFICATION):
+        with transaction.atomic():
+            tasks.send_confirmation_email(
+                Confirmation.objects.issue(self.user, purpose)
+            )
+
+    def test_repeat(self):
+        """Confirmation is sent once per purpose."""
+        self.send()
+        self.send()
+        self.send(Confirmation.RESTORE_PASSWORD)
+
+        self.assertEqual(Email.objects.count(), 2)
+
+    def test_new_code(self):
+        """New code of same purpose is throttled too."""
+        self.send()
+        Confirmation.objects.all().delete()
+        self.send()
+
+        self.assertEqual(Email.objects.count(), 1)
+
+    def test_rollback(self):
+        """Rolled back sending is retried."""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.send()
+                raise RuntimeError
+
+        self.send()
+
+        self.assertEqual(Email.objects.count(), 1)
+
+
+class TokenCacheTest(test.SimpleTestCase):
+
+    """Test tokens cache"""
+
+    def setUp(self):
+        """Setup tests."""
+        cache.clear()
+        self.cache = authentication.TokenCache(settings.AUTH_TOKEN_CACHE)
+
+    def test_stats(self):
+        """Count lookups by tier which answered them."""
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+        self.assertEqual(
+            self.cache.stats(), {'local': 2, 'shared': 1, 'miss': 1}
+        )
+
+
+class HashingExecutorTest(test.SimpleTestCase):
+
+    """Test hashing executor"""
+
+    def test_inline(self):
+        """Hash in calling thread."""
+        executor = hashing.HashingExecutor(workers=0, queue_size=0, timeout=1)
+
+        encoded = executor.call(hashers.make_password, 'pass')
+
+        self.assertTrue(hashers.check_password('pass', encoded))
+        self.assertEqual(executor.stats()['completed'], 1)
+
+    def test_pool(self):
+        """Hash in worker process."""
+        executor = hashing.HashingExecutor(workers=1, queue_size=0, timeout=5)
+        self.addCleanup(executor.pool.shutdown)
+
+        encoded = executor.call(hashers.make_password, 'pass')
+
+        self.assertEqual(
+            executor.call(hashing._check_password, 'pass', encoded),
+            (True, None)
+        )
+        self.assertEqual(executor.stats()['in_flight'], 0)
+
+    def test_saturated(self):
+        """Reject work when pool is saturated."""
+        executor = hashing.HashingExecutor(workers=1, queue_size=1, timeout=1)
+        for _ in range(executor.capacity):
+            executor.semaphore.acquire()
+
+        with self.assertRaises(hashing.HashingUnavailable):
+            executor.call(hashers.make_password, 'pass')
+
+        self.assertEqual(executor.stats()['rejected'], 1)
+
+    def test_timeout(self):
+        """Count timed out work as rejected only."""
+        executor = hashing.HashingExecutor(
+            workers=1, queue_size=0, timeout=0.01
+        )
+        self.addCleanup(executor.pool.shutdown)
+
+        with self.assertRaises(hashing.HashingUnavailable):
+            executor.call(time.sleep, 0.5)
+
+        stats = executor.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['completed'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+
+
+class CalibrateHashersTest(test.SimpleTestCase):
+
+    """Test hashers calibration"""
+
+    def test_recommend(self):
+        """Recommend parameters for target latency."""
+        stdout = six.StringIO()
+
+        call_command('calibrate_hashers', target=1, runs=1, stdout=stdout)
+
+        self.assertIn('PASSWORD_HASHER_PARAMS', stdout.getvalue())
+        self.assertIn(hashers.get_hasher().algorithm, stdout.getvalue())
+        self.assertIn('argon2', stdout.getvalue())
+
+
+class CleanConfirmationsTest(test.TestCase):
+
+    """Test expired confirmations cleaning"""
+
+    def setUp(self):
+        """Setup tests."""
+        user = get_user_model().objects.create_user(
+            'test@email.com', password='pass'
+        )
+        for _ in range(5):
+            Confirmation.objects.create(user=user)
+        Confirmation.objects.filter(
+            pk__in=Confirmation.objects.values_list('pk', flat=True)[:3]
+        ).update(expired=timezone.now())
+
+    def test_clean(self):
+        """Delete expired in batches."""
+        stdout = six.StringIO()
+
+        call_command(
+            'clean_confirmations', batch_size=2, pause=0, stdout=stdout
+        )
+
+        self.assertEqual(Confirmation.objects.count(), 2)
+        self.assertIn('Deleted 3', stdout.getvalue())
+
+    def test_dry_run(self):
+        """Dry run deletes nothing."""
+        stdout = six.StringIO()
+
+        call_command('clean_confirmations', dry_run=True, stdout=stdout)
+
+        self.assertEqual(Confirmation.objects.count(), 5)
+        self.assertIn('Found 3', stdout.getvalue())
+
+
+class EmailsTest(test.SimpleTestCase):
+
+    """Test emails rendering"""
+
+    def test_render(self):
+        """Render html and plain text parts."""
+        subject, message, html_message = emails.render(
+            emails.VERIFICATION, {'code': '123456'}
+        )
+
+        self.assertIn('123456', message)
+        self.assertNotIn('<', message)
+        self.assertIn('<strong>123456</strong>', html_message)
+
+    def test_cache(self):
+        """Compile template once per language."""
+        templates = emails.get_templates(emails.VERIFICATION['template'])
+
+        self.assertIs(
+            emails.get_templates(emails.VERIFICATION['template']), templates
+        )
+
+    def test_html_to_text(self):
+        """Derive text from html."""
+        self.assertEqual(
+            emails.html_to_text('<p>One</p>\n<p>Two <b>2</b></p>'),
+            'One\nTwo 2'
+        )
+
+
+class ImportUsersTest(test.TestCase):
+
+    """Test users import"""
+
+    def setUp(self):
+        """Setup tests."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        get_user_model().objects.create_user(
+            'existing@email.com', password='pass'
+        )
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv(self):
+        """Import csv hashing passwords in pool."""
+        path = self.write('users.csv', (
+            'email,name,surname,password\n'
+            'first@EMAIL.com,First,User,pass\n'
+            'existing@email.com,Existing,User,pass\n'
+            'first@email.com,Duplicate,User,pass\n'
+        ))
+
+        call_command(
+            'import_users', path, workers=1, stdout=six.StringIO()
+        )
+        user = get_user_model().objects.get(email='first@email.com')
+
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertEqual(user.name, 'First')
+        self.assertTrue(user.is_active)
+        self.assertTrue(user.check_password('pass'))
+
+    def test_jsonl(self):
+        """Import jsonl with hashed passwords."""
+        encoded = hashers.make_password('pass')
+        path = self.write('users.jsonl', '\n'.join(
+            json.dumps({'email': 'user{}@email.com'.format(i),
+                        'password_hash': encoded})
+            for i in range(5)
+        ))
+
+        call_command(
+            'import_users', path, workers=0, batch_size=2,
+            stdout=six.StringIO()
+        )
+
+        self.assertEqual(get_user_model().objects.count(), 6)
+        self.assertEqual(
+            get_user_model().objects.get(email='user4@email.com').password,
+            encoded
+        )
+
+    def test_resume(self):
+        """Resume from checkpoint."""
+        path = self.write('users.jsonl', '\n'.join(
+            json.dumps({'email': 'user{}@email.com'.format(i)})
+            for i in range(5)
+        ))
+        checkpoint = self.write('checkpoint', '3')
+
+        call_command(
+            'import_users', path, workers=0, checkpoint=checkpoint,
+            stdout=six.StringIO()
+        )
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), '5')
+
+
+class ExportUsersTest(test.TestCase):
+
+    """Test users export command"""
+
+    def test_file(self):
+        """Export to file."""
+        get_user_model().objects.create_user('user@email.com', password='pass')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'users.ndjson')
+
+        call_command('export_users', format='ndjson', output=path)
+
+        with open(path) as f:
+            self.assertEqual(json.loads(f.read())['email'], 'user@email.com')
+
+    def test_stdout(self):
+        """Export to command output."""
+        get_user_model().objects.create_user('user@email.com', password='pass')
+        stdout = six.StringIO()
+
+        call_command('export_users', stdout=stdout)
+
+        self.assertIn('user@email.com', stdout.getvalue())
+
+
+class UserAdminTest(test.TestCase):
+
+    """Test users admin"""
+
+    url = reverse('admin:users_user_changelist')
+
+    def setUp(self):
+        """Setup tests."""
+        self.admin = get_user_model().objects.create_superuser(
+            email='admin@email.com', password='pass'
+        )
+        self.client.force_login(self.admin)
+        self.users = [
+            get_user_model().objects.create_user(
+                'user{}@email.com'.format(i), password='pass',
+                surname='Surname{}'.format(i), is_active=True
+            ) for i in range(3)
+        ]
+
+    def test_search(self):
+        """Search by prefix."""
+        response = self.client.get(self.url, {'q': 'surname1'})
+
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.users[1]]
+        )
+        self.assertEqual(
+            len(self.client.get(self.url, {'q': 'name1'}).context['cl']
+                .result_list), 0
+        )
+
+    def test_deactivate(self):
+        """Deactivate with single update and revoke tokens."""
+        pks = [user.pk for user in self.users[:2]]
+
+        response = self.client.post(self.url, {
+            'action': 'deactivate', '_selected_action': pks,
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            get_user_model().objects.filter(is_active=False).count(), 2
+        )
+        self.assertEqual(denylist.get(pks[0]), denylist.REVOKE_ALL)
+        self.assertNotEqual(
+            denylist.get(self.users[2].pk), denylist.REVOKE_ALL
+        )
+
+    def test_estimated_count(self):
+        """Count estimated for large tables only."""
+        class Estimated(admin.EstimatedCountPaginator):
+            def estimate(self):
+                return self.ESTIMATE_THRESHOLD
+
+        queryset = get_user_model().objects.order_by('pk')
+
+        self.assertEqual(
+            Estimated(queryset, 10).count,
+            admin.EstimatedCountPaginator.ESTIMATE_THRESHOLD
+        )
+        self.assertEqual(
+            admin.EstimatedCountPaginator(queryset, 10).count, 4
+        )
+
+    def test_deactivate_cached_token(self):
+        """Deactivate drops cached database tokens."""
+        token = Token.objects.create(user=self.users[0])
+        token_cache.set(token.key, (self.users[0], token))
+
+        self.client.post(self.url, {
+            'action': 'deactivate', '_selected_action': [self.users[0].pk],
+        })
+
+        self.assertIsNone(token_cache.get(token.key))
+
+
+class CanonicalizeEmailsTest(test.TestCase):
+
+    """Test emails canonicalization"""
+
+    def test_canonicalize(self):
+        """Case fold emails and report duplicates."""
+        model = get_user_model()
+        model.objects.create_user('first@email.com', password='pass')
+        for i, email in enumerate(
+                ('First@Email.com', 'Second@Email.com', ' third@email.com')):
+            user = model.objects.create_user(
+                'user{}@email.com'.format(i), password='pass'
+            )
+            model.objects.filter(pk=user.pk).update(email=email)
+        stdout, stderr = six.StringIO(), six.StringIO()
+
+        call_command(
+            'canonicalize_emails', batch_size=2, pause=0,
+            stdout=stdout, stderr=stderr
+        )
+
+        self.assertEqual(
+            sorted(model.objects.values_list('email', flat=True)),
+            ['First@Email.com', 'first@email.com', 'second@email.com',
+             'third@email.com']
+        )
+        self.assertIn('2 emails, 1 duplicates', stdout.getvalue())
+        self.assertIn('First@Email.com', stderr.getvalue())
+
+    def test_lookup(self):
+        """Lookups are case insensitive."""
+        user = get_user_model().objects.create_user(
+            'Test@Email.com', password='pass'
+        )
+
+        self.assertEqual(user.email, 'test@email.com')
+        self.assertEqual(
+            get_user_model().objects.get_by_natural_key('TEST@email.com'),
+            user
+        )
@@ -0,0 +1,68 @@
+# coding=utf-8
+
+"""Stateless HMAC signed access tokens.
+
+Token is `<user id>.<expires>.<version>.<signature>` with base36 encoded
+numbers, so it is verified without database access.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils.encoding import force_bytes
+from django.utils.http import base36_to_int, int_to_base36
+
+SALT = 'users.tokens'
+SEPARATOR = '.'
+
+
+class InvalidToken(Exception):
+
+    """Token is malformed, forged or expired."""
+
+
+def signature(value):
+    """Signature of token payload."""
+    key = hashlib.sha256(force_bytes(SALT + settings.SECRET_KEY)).digest()
+    digest = hmac.new(key, force_bytes(value), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def is_signed(token):
+    """Signed tokens are distinguished from database ones by separator."""
+    return SEPARATOR in token
+
+
+def issue(user, lifetime=None):
+    """Issue signed token for user."""
+    if lifetime is None:
+        lifetime = settings.AUTH_SIGNED_TOKEN['LIFETIME']
+
+    value = SEPARATOR.join(
+        int_to_base36(number) for number in
+        (user.pk, int(time.time() + lifetime), user.token_version)
+    )
+    return value + SEPARATOR + signature(value)
+
+
+def verify(token):
+    """Verify token, returns `(user_id, version)` pair."""
+    try:
+        value, sign = token.rsplit(SEPARATOR, 1)
+        user_id, expires, version = [
+            base36_to_int(number) for number in value.split(SEPARATOR)
+        ]
+    except ValueError:
+        raise InvalidToken()
+
+    if not constant_time_compare(sign, signature(value)):
+        raise InvalidToken()
+
+    if expires < time.time():
+        raise InvalidToken()
+
+    return user_id, version
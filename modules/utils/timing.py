@@ -0,0 +1,88 @@
+# coding=utf-8
+
+"""Timings of code paths within current request.
+
+Code paths worth watching are wrapped in `timer(name)`, which records
+elapsed time into recorder started for current request and does nothing
+outside of it. Recording requests is up to caller, see `start` and
+`stop`.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+_local = threading.local()
+
+
+class Recorder(object):
+
+    """Timings of single request."""
+
+    def __init__(self):
+        self.started = default_timer()
+        self.durations = OrderedDict()
+        self.queries = 0
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0) + duration
+
+
+def current():
+    """Recorder of current request or None."""
+    return getattr(_local, 'recorder', None)
+
+
+def start():
+    """Start recording timings in current thread."""
+    _local.recorder = Recorder()
+    return _local.recorder
+
+
+def stop():
+    """Stop recording, returns recorder or None if not started."""
+    recorder = current()
+    _local.recorder = None
+    return recorder
+
+
+@contextmanager
+def timer(name):
+    """Record elapsed time of block into current request timings."""
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+
+    started = default_timer()
+    try:
+        yield
+    finally:
+        recorder.add(name, default_timer() - started)
+
+
+class QueryLog(object):
+
+    """Queries run on connection while active, from debug cursor log.
+
+    Debug cursor is forced on for the block, connection is not opened.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = []
+
+    def __enter__(self):
+        self.forced = self.connection.force_debug_cursor
+        self.logged = len(self.connection.queries_log)
+        self.connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.force_debug_cursor = self.forced
+        self.queries = list(self.connection.queries_log)[self.logged:]
+
+    @property
+    def duration(self):
+        return sum(float(query['time']) for query in self.queries)
@@ -32,9 +32,14 @@ INSTALLED_APPS = (
     'rest_framework_swagger',
 
     'users',
+    'notifications',
 )
 
 MIDDLEWARE_CLASSES = (
+    'api.middleware.ScopedMiddleware',
+)
+
+FULL_MIDDLEWARE = (
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -45,6 +50,17 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.security.SecurityMiddleware',
 )
 
+# Middleware chain per path prefix, first match wins. API is token
+# authenticated, sessions, CSRF, messages and clickjacking are skipped.
+SCOPED_MIDDLEWARE = (
+    ('/api/', (
+        'api.timing.TimingMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+    )),
+    ('/', FULL_MIDDLEWARE),
+)
+
 ROOT_URLCONF = 'urls'
 
 TEMPLATES = [
@@ -102,6 +118,12 @@ LOGGING = {
             'filename': os.path.join(LOGS_DIR, 'exceptions.log'),
             'formatter': 'verbose'
         },
+        'performance': {
+            'level': 'WARNING',
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(LOGS_DIR, 'performance.log'),
+            'formatter': 'verbose'
+        },
     },
     'loggers': {
         'django': {
@@ -120,11 +142,26 @@ LOGGING = {
         'py.warnings': {
             'handlers': ['console'],
         },
+        'api': {
+            'handlers': ['console', 'performance'],
+            'level': 'WARNING',
+        },
     }
 }
 
 AUTH_USER_MODEL = 'users.User'
 
+PASSWORD_HASHERS = (
+    'users.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'users.hashers.Argon2PasswordHasher',
+    'users.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+)
+
+# Hashers cost parameters by algorithm, see `calibrate_hashers` command.
+PASSWORD_HASHER_PARAMS = {}
+
 LANGUAGE_CODE = 'en'
 LANGUAGES = (
     ('en', _('English')),
@@ -149,9 +186,68 @@ DEFAULT_FROM_EMAIL = SERVER_EMAIL = None
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    )
+    ),
+    # Use orjson when installed, stock JSON otherwise.
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+AUTH_TOKEN_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 60 * 60,
+    'LOCAL_SIZE': 10000,
+    'LOCAL_TIMEOUT': 10,
+}
+
+# `database` for rest_framework.authtoken tokens or `signed` for stateless
+# tokens. Database tokens are accepted in both modes.
+AUTH_TOKEN_MODE = 'database'
+
+AUTH_SIGNED_TOKEN = {
+    'CACHE': 'default',
+    'LIFETIME': 60 * 60 * 24 * 30,
+    'DENYLIST_SIZE': 10000,
+    'DENYLIST_SYNC': 30,
+}
+
+# `database` stores confirmation codes, `hmac` derives them from user state.
+CONFIRMATION_MODE = 'database'
+
+# Seconds in which same confirmation code is not sent again.
+CONFIRMATION_RESEND_INTERVAL = 60
+
+# Zero `WORKERS` hashes passwords in request thread.
+PASSWORD_HASHING = {
+    'WORKERS': 0,
+    'QUEUE_SIZE': 16,
+    'TIMEOUT': 10,
+}
+
+# Per request timings of API views. `HEADER` adds `Server-Timing` header,
+# `HISTOGRAMS` aggregates them per endpoint in process memory for metrics
+# endpoint. Either forces query logging for the request.
+REQUEST_TIMING = {
+    'HEADER': False,
+    'HISTOGRAMS': False,
+}
+
+# Views exceeding their `query_budget` are `off` not checked, `warn` logged
+# or `raise` error.
+QUERY_BUDGET = 'warn'
+
+# APNS gateway waits `APNS_ERROR_TIMEOUT` seconds for error response after
+# batch, invalid tokens are not detected without it.
+PUSH_NOTIFICATIONS_SETTINGS = {
+    'APNS_ERROR_TIMEOUT': 1,
 }
 
 SWAGGER_SETTINGS = {
@@ -4,7 +4,16 @@ from base import *
 
 DEBUG = True
 
+HOST = 'localhost:8000'
+
 ALLOWED_HOSTS = []
 
+QUERY_BUDGET = 'raise'
+
+REQUEST_TIMING = {
+    'HEADER': True,
+    'HISTOGRAMS': True,
+}
+
 STATICFILES_DIRS = [STATIC_ROOT]
 STATIC_ROOT = None